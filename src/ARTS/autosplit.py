@@ -3,6 +3,8 @@ import pandas as pd
 import geopandas as gpd
 import math
 import random
+import shapely
+import warnings
 
 
 def split_with_buffer(df, subset_names, probs, tile_size):
@@ -101,3 +103,95 @@ def split_with_buffer(df, subset_names, probs, tile_size):
     groups_df = groups_df.set_geometry('geometry')
 
     return groups_df
+
+
+def audit_split(split_results, tile_size, probs=None, df=None, min_distance=None, strict=False):
+    """
+     Checks that the subsets of a split are far enough apart that no training tile can hold features of two subsets,
+     and compares the achieved and requested subset ratios. Distances are found with bulk nearest-neighbour and
+     distance queries on a spatial index, one pair of subsets at a time.
+
+     @param split_results - Output of split_with_buffer. It must have the 'ID' and 'subset' columns.
+     @param tile_size - The tile size used for the split.
+     @param probs - Optional dict of subset name to requested ratio, e.g. {'train': 0.8, 'val': 0.1, 'test': 0.1}.
+     @param df - Optional dataframe that was split, with 'ID' and the 'TrainClass' and 'RegionName' columns, for
+                 ratios per TrainClass and RegionName.
+     @param min_distance - Minimum distance between features of different subsets. Defaults to the diagonal of a tile.
+     @param strict - Boolean. Should a ValueError be raised if any pair of features is too close?
+
+     @return dict with 'distances' (minimum distance between each pair of subsets), 'violations' (pairs of features
+             of different subsets closer than min_distance) and 'ratios' (achieved and requested ratios) dataframes
+    """
+    if min_distance is None:
+        min_distance = math.sqrt(tile_size**2 * 2)
+
+    subset_names = sorted(split_results['subset'].unique())
+    geometries = {
+        subset: np.asarray(split_results.geometry.values[(split_results['subset'] == subset).values])
+        for subset in subset_names
+    }
+    ids = {subset: split_results['ID'].values[(split_results['subset'] == subset).values] for subset in subset_names}
+
+    distances = []
+    violations = []
+    for idx, subset_a in enumerate(subset_names):
+        for subset_b in subset_names[idx + 1:]:
+            tree = shapely.STRtree(geometries[subset_b])
+
+            _, nearest_distances = tree.query_nearest(geometries[subset_a], return_distance=True, all_matches=False)
+            distances.append({
+                'subset_a': subset_a,
+                'subset_b': subset_b,
+                'min_distance': nearest_distances.min() if len(nearest_distances) > 0 else np.nan
+            })
+
+            idx_a, idx_b = tree.query(geometries[subset_a], predicate='dwithin', distance=min_distance)
+            violations.append(pd.DataFrame({
+                'ID_a': ids[subset_a][idx_a],
+                'subset_a': subset_a,
+                'ID_b': ids[subset_b][idx_b],
+                'subset_b': subset_b,
+                'distance': shapely.distance(geometries[subset_a][idx_a], geometries[subset_b][idx_b])
+            }))
+
+    distances = pd.DataFrame(distances, columns=['subset_a', 'subset_b', 'min_distance'])
+    violations = pd.concat(
+        violations, ignore_index=True
+    ) if len(violations) > 0 else pd.DataFrame(columns=['ID_a', 'subset_a', 'ID_b', 'subset_b', 'distance'])
+
+    # achieved vs requested ratios, overall and per TrainClass and RegionName
+    counts = split_results[['ID', 'subset']]
+    fields = []
+    if df is not None:
+        fields = [field for field in ['TrainClass', 'RegionName'] if field in df.columns]
+        counts = counts.merge(pd.DataFrame(df[['ID'] + fields]), on='ID', how='left')
+
+    ratios = []
+    for field in [None] + fields:
+        group_fields = ['subset'] if field is None else [field, 'subset']
+        group_counts = counts.groupby(group_fields, observed=True).size().rename('count').reset_index()
+        if field is None:
+            group_counts['achieved'] = group_counts['count'] / group_counts['count'].sum()
+        else:
+            group_counts['achieved'] = group_counts['count'] / group_counts.groupby(field)['count'].transform('sum')
+        group_counts.insert(0, 'field', 'All' if field is None else field)
+        group_counts.insert(1, 'value', 'All' if field is None else group_counts[field].astype(str))
+        ratios.append(group_counts[['field', 'value', 'subset', 'count', 'achieved']])
+
+    ratios = pd.concat(ratios, ignore_index=True)
+    ratios['requested'] = ratios['subset'].map(probs) if probs is not None else np.nan
+
+    print(distances)
+    print(ratios)
+
+    if violations.shape[0] > 0:
+        print(violations)
+        message = '{count} pairs of features in different subsets are closer than {distance}.'.format(
+            count=violations.shape[0], distance=round(min_distance, 2))
+        if strict:
+            raise ValueError(message)
+        warnings.warn(message)
+    else:
+        print('No features in different subsets are closer than ' + str(round(min_distance, 2)) + '.')
+
+    return {'distances': distances, 'violations': violations, 'ratios': ratios}
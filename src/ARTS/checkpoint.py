@@ -0,0 +1,174 @@
+import hashlib
+import json
+import os
+import pickle
+import pandas as pd
+import geopandas as gpd
+from pathlib import Path
+from .diff import geometry_hashes
+
+
+# files which belong to a shapefile and change its content
+SHAPEFILE_SIDECARS = ['.shp', '.shx', '.dbf', '.prj', '.cpg']
+
+
+def file_hash(filepath):
+    '''
+    Hashes the content of a file. For shapefiles, the .shx, .dbf, .prj and .cpg files are included.
+
+    @param filepath - The file path to hash.
+
+    @return hex digest
+    '''
+    filepath = Path(filepath)
+
+    if filepath.suffix.lower() == '.shp':
+        filepaths = [filepath.with_suffix(suffix) for suffix in SHAPEFILE_SIDECARS]
+        filepaths = [item for item in filepaths if item.exists()]
+    else:
+        filepaths = [filepath]
+
+    digest = hashlib.sha256()
+    for item in filepaths:
+        with open(item, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def data_hash(data):
+    '''
+    Hashes the content of a data frame: its columns, index, metadata values and the WKB of its geometries.
+
+    @param data - A pandas or geopandas dataframe.
+
+    @return hex digest
+    '''
+    geometry_columns = [column for column in data.columns if isinstance(data[column].dtype, gpd.array.GeometryDtype)]
+    attributes = data.drop(columns=geometry_columns)
+
+    try:
+        row_hashes = pd.util.hash_pandas_object(attributes, index=True).values
+    except TypeError:
+        # unhashable values, e.g. lists
+        row_hashes = pd.util.hash_pandas_object(attributes.astype(str), index=True).values
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in data.dtypes.items()]).encode())
+    digest.update(row_hashes.tobytes())
+    for column in geometry_columns:
+        digest.update(geometry_hashes(data[column]).tobytes())
+
+    return digest.hexdigest()
+
+
+def _describe(value, output_files=()):
+    '''
+    Describes a stage argument for the checkpoint key. Data frames (and data sets with a data frame in .data) are
+    described by a hash of their content, and paths of existing files by a hash of the file content, unless they are
+    written by the stage.
+    '''
+    if isinstance(value, (str, Path)) and str(value) in output_files:
+        return str(value)
+    if isinstance(value, pd.DataFrame):
+        return {'data': data_hash(value)}
+    if hasattr(value, 'data') and isinstance(value.data, pd.DataFrame):
+        return {'data': data_hash(value.data)}
+    if isinstance(value, (str, Path)) and os.path.isfile(value):
+        return {'path': str(value), 'hash': file_hash(value)}
+    if isinstance(value, (list, tuple)):
+        return [_describe(item, output_files) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _describe(item, output_files) for key, item in value.items()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+
+    return str(value)
+
+
+class Checkpoints:
+    '''
+    Content-addressed cache of the output of each stage of the formatting pipeline. The key of a stage is built from
+    the stage name, the hashes of its input files, of file path arguments and of data frame arguments, the main data
+    set version and its parameters. It only depends on the content of the inputs, so any stage whose inputs have not
+    changed is loaded, whatever order the stages are run in, and any stage whose inputs have is run again. Files
+    written by a stage (e.g. the overlapping file saved by check_intersections) are not written again when the stage
+    is loaded from a checkpoint.
+    '''
+
+    def __init__(self, directory, version=None):
+        '''
+        @param directory - The directory in which to save the checkpoints.
+        @param version - The version of the main ARTS data set, e.g. 'v.3.1.0'.
+        '''
+        self.directory = Path(directory)
+        self.version = version
+
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, stage, args=(), kwargs=None, input_files=(), params=None, output_files=()):
+        '''
+        Builds the checkpoint key of a stage.
+
+        @return hex digest
+        '''
+        output_files = set(str(item) for item in output_files)
+        description = {
+            'stage': stage,
+            'version': self.version,
+            'input_files': [file_hash(item) for item in input_files],
+            'args': _describe(list(args), output_files),
+            'kwargs': _describe(kwargs or {}, output_files),
+            'params': _describe(params or {})
+        }
+
+        return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    def filepath(self, stage, key):
+        return self.directory / (stage + '-' + key[:16] + '.pkl')
+
+    def stage(self, stage, func, *args, input_files=(), output_files=(), params=None, **kwargs):
+        '''
+        Runs a stage of the pipeline, or loads its output if a checkpoint with the same key exists.
+
+        @param stage - The name of the stage, e.g. 'check_intersections'.
+        @param func - The function to run, e.g. dataformatting.check_intersections.
+        @param args - Positional arguments of func. The content of data frames and of existing files passed as paths
+                      is part of the key.
+        @param input_files - Other file paths read by the stage (e.g. the manually edited file). Their content is part
+                             of the key. Missing files are skipped.
+        @param output_files - File paths written by the stage (e.g. the overlapping file). They are passed to func but
+                              are not part of the key, so writing them does not invalidate the checkpoint.
+        @param params - Optional dict of other values that change the output of the stage.
+        @param kwargs - Keyword arguments of func.
+
+        @return output of func
+        '''
+        input_files = [item for item in input_files if item is not None and Path(item).exists()]
+        key = self.key(stage, args, kwargs, input_files, params, output_files)
+        filepath = self.filepath(stage, key)
+
+        if filepath.exists():
+            with open(filepath, 'rb') as file:
+                result = pickle.load(file)
+            print('Loaded ' + stage + ' from checkpoint ' + str(filepath))
+
+        else:
+            result = func(*args, **kwargs)
+
+            # write to a temporary file first, so an interrupted run never leaves a broken checkpoint
+            temporary_filepath = filepath.with_suffix('.tmp')
+            with open(temporary_filepath, 'wb') as file:
+                pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_filepath, filepath)
+
+        return result
+
+    def clear(self):
+        '''
+        Deletes all checkpoints.
+        '''
+        for filepath in self.directory.glob('*.pkl'):
+            os.remove(filepath)
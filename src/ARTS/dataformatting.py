@@ -7,6 +7,12 @@ import re
 from datetime import datetime
 from pathlib import Path
 from tqdm.auto import tqdm
+from .schema import decode_uids, uid_mask, publishable
+from .release import write_flatgeobuf, hilbert_sort, check_geometries
+from .stats import summarize, merge_stats, read_stats, write_stats, stats_path
+from .dataset import ARTSDataset
+from .dedup import report_duplicates
+from .geomstore import GeometryStore, intersecting_uids
 
 
 def add_empty_columns(df, column_names):
@@ -112,7 +118,7 @@ def get_intersecting_uids(polygon, main_data):
     '''
     intersecting_df = polygon.sjoin(main_data, how = 'right', predicate = 'intersects')
     intersecting_df = intersecting_df[~np.isnan(intersecting_df.index_left)]
-    intersections = [','.join(list(intersecting_df.UID_right))]
+    intersections = [','.join(decode_uids(intersecting_df.UID_right))]
     return intersections
 
 
@@ -128,7 +134,7 @@ def get_touching_uids(polygon, main_data):
     '''
     adjacent_df = polygon.sjoin(main_data, how = 'right', predicate = 'touches')
     adjacent_df = adjacent_df[~np.isnan(adjacent_df.index_left)]
-    adjacent_polys = [','.join(list(adjacent_df.UID_right))]
+    adjacent_polys = [','.join(decode_uids(adjacent_df.UID_right))]
     return adjacent_polys
 
 
@@ -327,7 +333,8 @@ def run_formatting_checks(df):
 
 def check_uids(uid):
     '''
-    Checks that the UID format is correct and not missing.
+    Checks that the UID format is correct and not missing. UIDs must be lowercase hexadecimal UUIDs, as written by
+    str(uuid.uuid5(...)), so that they are converted to binary UIDs and back without any change.
 
     @param uid - The column which contains UIDs.
     '''
@@ -339,7 +346,7 @@ def check_uids(uid):
         [[len(element) for element in item] == [8, 4, 4, 4, 12] for item in split_uids]
     )
     correct_components = np.all(
-        [np.all([bool(re.search('^[0-9a-zA-Z]+$', element)) for element in item]) for item in split_uids]
+        [np.all([bool(re.search('^[0-9a-f]+$', element)) for element in item]) for item in split_uids]
     )
 
     if not correct_type:
@@ -439,10 +446,11 @@ def classify_negatives(overlapping_data, main_data):
     Automatically classify overlapping UIDs which are negative bounding boxes that overlap other negative bounding boxes.
 
     @param overlapping_data - The overlapping data set.
-    @param main_data - The main ARTS data set.
+    @param main_data - The main ARTS data set, as a geopandas dataframe or an ARTSDataset.
     '''
 
     negative_classifications = []
+    dataset = main_data if isinstance(main_data, ARTSDataset) else None
     
     for intersection, self_intersection, train_class, base_map_date in zip(
         tqdm(overlapping_data.Intersections), 
@@ -455,11 +463,15 @@ def classify_negatives(overlapping_data, main_data):
         self_intersection_split = self_intersection.split(',')
         dates = [int(date.split('-')[0]) for date in base_map_date.split(',')]
 
+        if dataset is not None:
+            # only rows with one of the intersecting UIDs can match below, so use the UID index instead of a full scan
+            main_data = dataset.rows(intersection_split)
+
         if train_class == 'Negative' and (len(intersection) > 0 or len(self_intersection) > 0):
 
             # repeat negatives
-            uids_negative_main = list(
-                main_data.loc[(main_data.UID.isin(intersection_split)) & (main_data.TrainClass == 'Negative')]
+            uids_negative_main = decode_uids(
+                main_data.loc[(uid_mask(main_data.UID, intersection_split)) & (main_data.TrainClass == 'Negative')]
                 .UID
             )
             
@@ -476,10 +488,10 @@ def classify_negatives(overlapping_data, main_data):
             )
             
             # false negatives
-            uids_old_main = list(
+            uids_old_main = decode_uids(
                 main_data.loc[
                 (
-                    main_data.UID.isin(intersection_split)
+                    uid_mask(main_data.UID, intersection_split)
                 ) & (
                     main_data.TrainClass == 'Positive'
                 ) & (
@@ -522,10 +534,10 @@ def classify_negatives(overlapping_data, main_data):
                     ][0] > dates[1] for map_dates in main_data.BaseMapDate
                 ])
             uids_new_main = uids_new_main.sort_values('year').groupby('UID').head(1)
-            uids_new_main = list(
+            uids_new_main = decode_uids(
                 uids_new_main.loc[
                 (
-                    uids_new_main.UID.isin(intersection_split)
+                    uid_mask(uids_new_main.UID, intersection_split)
                 ) & (
                     uids_new_main.TrainClass == 'Positive'
                 ) & (
@@ -567,10 +579,10 @@ def classify_negatives(overlapping_data, main_data):
             repeat_negative = ''
             
             # false negatives
-            uids_old_main = list(
+            uids_old_main = decode_uids(
                 main_data.loc[
                 (
-                    main_data.UID.isin(intersection_split)
+                    uid_mask(main_data.UID, intersection_split)
                 ) & (
                     main_data.TrainClass == 'Negative'
                 ) & (
@@ -606,10 +618,10 @@ def classify_negatives(overlapping_data, main_data):
             )
 
             # new rts
-            uids_new_main = list(
+            uids_new_main = decode_uids(
                 main_data.loc[
                 (
-                    main_data.UID.isin(intersection_split)
+                    uid_mask(main_data.UID, intersection_split)
                 ) & (
                     main_data.TrainClass == 'Negative'
                 ) & (
@@ -659,37 +671,52 @@ def classify_negatives(overlapping_data, main_data):
     return negative_classifications
 
 
-def check_intersections(new_data, main_data, out_path, demo):
+def check_intersections(new_data, main_data, out_path, demo, max_workers=None):
     '''
     Check intersections between data to be submitted and the main data set.
 
     @param new_data - The new RTS data set.
-    @param main_data - The main RTS data set.
+    @param main_data - The main RTS data set, as a geopandas dataframe, an ARTSDataset or a GeometryStore. With a
+                       GeometryStore, intersections are found across a process pool which shares the memory-mapped
+                       store, and only the intersecting features are loaded to classify negatives.
     @param out_path - The file path where you would like to save the intersecting polygon data set.
     @param demo - Boolean. Are you running this script as a demo? 
+    @param max_workers - Number of worker processes used with a GeometryStore. Defaults to the number of CPUs.
 
     @return geopandas dataframe with intersecting features
     '''
 
     print('Getting intersections')
-    intersections = []
-    adjacent_polys = []
-    
-    
-    for idx in tqdm(range(0, new_data.shape[0])):
-        new_intersections = get_intersecting_uids(
-            new_data.iloc[[idx]], main_data)
-        intersections = intersections + new_intersections
 
-        new_adjacent_polys = get_touching_uids(new_data.iloc[[idx]], main_data)
-        adjacent_polys = adjacent_polys + new_adjacent_polys
+    if isinstance(main_data, GeometryStore):
+        new_data['Intersections'] = intersecting_uids(main_data, new_data.geometry, max_workers)
 
-    new_data['Intersections'] = intersections
-    new_data['AdjacentPolys'] = adjacent_polys
+        # classify_negatives only looks up the intersecting features
+        main_data = main_data.to_geodataframe(main_data.uid_positions(
+            set(uid for item in new_data.Intersections for uid in item.split(',') if uid != '')))
 
-    new_data.Intersections = remove_adjacent_polys(
-        new_data.Intersections, new_data.AdjacentPolys
-    )
+    elif isinstance(main_data, ARTSDataset):
+        # one bulk query against the spatial index instead of a spatial join per polygon
+        new_data['Intersections'] = main_data.intersecting_uids(new_data.geometry)
+
+    else:
+        intersections = []
+        adjacent_polys = []
+
+        for idx in tqdm(range(0, new_data.shape[0])):
+            new_intersections = get_intersecting_uids(
+                new_data.iloc[[idx]], main_data)
+            intersections = intersections + new_intersections
+
+            new_adjacent_polys = get_touching_uids(new_data.iloc[[idx]], main_data)
+            adjacent_polys = adjacent_polys + new_adjacent_polys
+
+        new_data['Intersections'] = intersections
+        new_data['AdjacentPolys'] = adjacent_polys
+
+        new_data.Intersections = remove_adjacent_polys(
+            new_data.Intersections, new_data.AdjacentPolys
+        )
     
     print('Getting self intersections')
     intersections = []
@@ -711,7 +738,7 @@ def check_intersections(new_data, main_data, out_path, demo):
         new_data.SelfIntersections, new_data.SelfAdjacentPolys
     )
 
-    new_data = new_data.drop(['AdjacentPolys', 'SelfAdjacentPolys'], axis = 1)
+    new_data = new_data.drop(['AdjacentPolys', 'SelfAdjacentPolys'], axis = 1, errors = 'ignore')
     
     overlapping_data = new_data.copy()
     overlapping_data = overlapping_data[(overlapping_data['Intersections'].str.len(
@@ -852,7 +879,7 @@ def remove_old_false_negatives(main_data, new_data) :
     
     uids = new_data[(new_data.TrainClass == 'Positive') & (new_data.FalseNegative.str.len() > 0)].FalseNegative
     
-    main_data = main_data[(main_data.UID.isin(uids)) & (main_data.TrainClass == 'Negative')]
+    main_data = main_data[(uid_mask(main_data.UID, uids)) & (main_data.TrainClass == 'Negative')]
     
     return main_data
 
@@ -892,7 +919,7 @@ def seed_gen(new_data):
     return new_data
 
 
-def output(new_data, main_data, new_fields, all_fields, base_dir, new_data_file, updated_filepath, separate_file, demo, updated_main):
+def output(new_data, main_data, new_fields, all_fields, base_dir, new_data_file, updated_filepath, separate_file, demo, updated_main, main_filepath=None):
     '''
     select the desired fields and save the geopandas dataframe to file
 
@@ -902,25 +929,36 @@ def output(new_data, main_data, new_fields, all_fields, base_dir, new_data_file,
     @param all_fields - A list of all the metadata fields to be included in output.
     @param base_dir - The base directory in which to save the output.
     @param new_data_file - The file name of the new RTS dataset.
-    @param updated_filepath - The file name of the main ARTS dataset.
+    @param updated_filepath - The directory of the new version of the main ARTS dataset, e.g.
+                              ARTS_main_dataset/v.3.1.0. The release is saved in it as ARTS_main_dataset_v.3.1.0.geojson,
+                              with its FlatGeobuf copy and statistics catalog.
     @param demo - Boolean. Are you running this script as a demo? 
     @param updated_main - Boolean. Was the main ARTS dataset updated during processing?
+    @param main_filepath - Optional file path of the main ARTS dataset. If it has a statistics catalog next to it
+                           (e.g. ARTS_main_dataset_v.3.1.0_stats.json) and the main dataset was not updated, the
+                           catalog is updated from the new data only.
 '''
 
     if demo == False:
 
         if separate_file:
 
+            report_duplicates(pd.concat([
+                publishable(main_data[['UID', 'geometry']]),
+                publishable(new_data[['UID', 'geometry']])
+            ], ignore_index=True))
+
             filepath = base_dir / 'output' / (
                 str(new_data_file).split('.', maxsplit=1)[
                     0] + "_formatted.geojson"
             )
             
-            new_data.to_file(filepath)
+            hilbert_sort(publishable(new_data)).to_file(filepath)
             print(str(filepath))
+            print(str(write_stats(summarize(new_data), filepath)))
 
             if updated_main:
-                main_data.to_file(base_dir / 'output/ARTS_main_dataset.geojson')
+                hilbert_sort(publishable(main_data)).to_file(base_dir / 'output/ARTS_main_dataset.geojson')
 
         else:
 
@@ -929,17 +967,35 @@ def output(new_data, main_data, new_fields, all_fields, base_dir, new_data_file,
                 [col for col in new_fields]
             )
 
-            if not type(main_data.ContributionDate[0]) == str:
-                main_data.ContributionDate = [value.strftime(
-                    '%Y-%m-%d') for value in main_data.ContributionDate]
+            # categorical fields, binary UIDs and dates are only converted to their published form here
+            main_data = publishable(main_data[all_fields + ['geometry']])
+            # spatially clustered row order, which only follows the order of contributions for fully tied rows
+            updated_data = hilbert_sort(pd.concat([main_data, publishable(new_data)]))
+
+            report_duplicates(updated_data)
 
-            main_data = main_data[all_fields + ['geometry']]
-            updated_data = pd.concat([main_data, new_data])
+            # checked before anything is written, so a failure never leaves a partial release
+            check_geometries(updated_data)
 
             if not os.path.exists(updated_filepath):
                 os.mkdir(updated_filepath)
-                
-            updated_filepath = updated_filepath / 'ARTS_main_dataset.geojson'
+
+            # named after the version (e.g. v.3.1.0/ARTS_main_dataset_v.3.1.0.geojson), like the published releases,
+            # so the FlatGeobuf copy and statistics catalog are found from the file path of the next main dataset
+            updated_filepath = updated_filepath / ('ARTS_main_dataset_' + Path(updated_filepath).name + '.geojson')
 
             updated_data.to_file(updated_filepath)
             print(str(updated_filepath))
+
+            # indexed copy of the release for reading spatial subsets
+            print(str(write_flatgeobuf(updated_data, updated_filepath)))
+
+            # statistics catalog, updated from the aggregates of the new data only if the main dataset is unchanged
+            main_stats = read_stats(main_filepath) if main_filepath is not None and not updated_main else None
+            if main_stats is None or main_stats['count'] != main_data.shape[0]:
+                # missing, or out of date with the main dataset (e.g. rows were edited or removed by hand)
+                if main_filepath is not None and not updated_main:
+                    print('No up-to-date statistics catalog at ' + str(stats_path(main_filepath)) +
+                          '. Summarizing the main dataset.')
+                main_stats = summarize(main_data)
+            print(str(write_stats(merge_stats(main_stats, summarize(new_data)), updated_filepath)))
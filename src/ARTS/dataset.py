@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from .schema import compact, decode_uids, UIDIndex
+
+
+def basemap_date_range(basemap_date):
+    '''
+    Gets the first and last date of each base map date. Single dates are used as both the start and the end.
+
+    @param basemap_date - The column that contains the base map date.
+
+    @return (start, end) numpy arrays of datetime64[D]
+    '''
+    if len(basemap_date) == 0:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype='datetime64[D]')
+
+    split_dates = basemap_date.astype(str).str.split(',', n=1, expand=True)
+    if split_dates.shape[1] == 1:
+        split_dates[1] = None
+
+    start = pd.to_datetime(split_dates[0].str.strip(), format='%Y-%m-%d', errors='coerce')
+    end = pd.to_datetime(split_dates[1].str.strip(), format='%Y-%m-%d', errors='coerce').fillna(start)
+
+    return start.values.astype('datetime64[D]'), end.values.astype('datetime64[D]')
+
+
+def _as_date(value, end_of_year):
+    '''
+    Converts a query date to datetime64[D]. Integers are treated as years.
+    '''
+    if isinstance(value, (int, np.integer)):
+        value = str(value) + ('-12-31' if end_of_year else '-01-01')
+
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+class ARTSDataset:
+    '''
+    An ARTS release held in memory with three indexes: an STRtree over the geometries, a UID index and a sorted
+    interval index over the base map dates. Queries combine the indexes instead of scanning the data set.
+    '''
+
+    def __init__(self, data):
+        '''
+        @param data - The ARTS data set, in either the published or the in-memory schema.
+        '''
+        self.data = compact(data).reset_index(drop=True)
+
+        self.sindex = self.data.sindex
+        self.uid_index = UIDIndex(self.data.UID)
+
+        self.start, self.end = basemap_date_range(self.data.BaseMapDate)
+        self.start_order = np.argsort(self.start, kind='stable')
+        self.sorted_start = self.start[self.start_order]
+        self.end_order = np.argsort(self.end, kind='stable')
+        self.sorted_end = self.end[self.end_order]
+
+    @classmethod
+    def read(cls, filepath, **kwargs):
+        '''
+        Reads a release and builds the indexes.
+
+        @param filepath - The file path of the release.
+        @param kwargs - Passed on to release.read_release (e.g. bbox or region).
+
+        @return ARTSDataset
+        '''
+        from .release import read_release
+
+        return cls(read_release(filepath, **kwargs))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def spatial_positions(self, geometry, predicate='intersects'):
+        '''
+        Gets the rows whose geometry satisfies a predicate with the query geometry.
+
+        @param geometry - A shapely geometry in the CRS of the data set.
+        @param predicate - Any predicate supported by the STRtree, e.g. 'intersects', 'contains' or 'within'.
+
+        @return sorted numpy array of row positions
+        '''
+        return np.sort(self.sindex.query(geometry, predicate=predicate))
+
+    def temporal_positions(self, start=None, end=None):
+        '''
+        Gets the rows whose base map date range overlaps the query range. Integers are treated as years, so
+        start=2015, end=2019 returns rows observed at any time between 2015-01-01 and 2019-12-31.
+
+        @param start - Start of the query range. If None, the range is open.
+        @param end - End of the query range. If None, the range is open.
+
+        @return sorted numpy array of row positions
+        '''
+        n_before_end = len(self) if end is None else np.searchsorted(
+            self.sorted_start, _as_date(end, end_of_year=True), side='right')
+        n_after_start = len(self) if start is None else len(self) - np.searchsorted(
+            self.sorted_end, _as_date(start, end_of_year=False), side='left')
+
+        # take the smaller side of the interval index and check the other bound on those rows only
+        if n_before_end <= n_after_start:
+            positions = self.start_order[:n_before_end]
+            if start is not None:
+                positions = positions[self.end[positions] >= _as_date(start, end_of_year=False)]
+        else:
+            positions = self.end_order[len(self) - n_after_start:]
+            if end is not None:
+                positions = positions[self.start[positions] <= _as_date(end, end_of_year=True)]
+
+        # rows without a readable base map date never match a temporal query
+        positions = positions[~np.isnat(self.start[positions])]
+
+        return np.sort(positions)
+
+    def attribute_mask(self, positions, **attributes):
+        '''
+        Filters rows by metadata values. Categorical fields are compared on their codes.
+
+        @param positions - Row positions to filter.
+        @param attributes - Field names and a value or list of values, e.g. TrainClass='Positive'.
+
+        @return boolean numpy array, one value per position
+        '''
+        mask = np.ones(len(positions), dtype=bool)
+
+        for field, values in attributes.items():
+            if field not in self.data.columns:
+                raise ValueError('{field} is not a column of the data set.'.format(field=repr(field)))
+
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            column = self.data[field]
+
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                codes = [column.cat.categories.get_loc(value) for value in values if value in column.cat.categories]
+                mask &= np.isin(column.cat.codes.values[positions], codes)
+            else:
+                mask &= column.iloc[positions].isin(values).values
+
+        return mask
+
+    def positions(self, geometry=None, predicate='intersects', start=None, end=None, uids=None, **attributes):
+        '''
+        Gets the rows which satisfy all of the given conditions, e.g.
+        positions(polygon, start=2015, end=2019, TrainClass='Positive', CreatorLab='...').
+
+        @param geometry - Optional shapely geometry in the CRS of the data set.
+        @param predicate - Spatial predicate used with geometry.
+        @param start - Optional start of the base map date range.
+        @param end - Optional end of the base map date range.
+        @param uids - Optional list of UIDs.
+        @param attributes - Optional field names and values to match.
+
+        @return sorted numpy array of row positions
+        '''
+        positions = None
+
+        if geometry is not None:
+            positions = self.spatial_positions(geometry, predicate)
+
+        if uids is not None:
+            uid_positions = np.unique(self.uid_index.positions(uids))
+            positions = uid_positions if positions is None else np.intersect1d(positions, uid_positions)
+
+        if start is not None or end is not None:
+            if positions is None:
+                positions = self.temporal_positions(start, end)
+            else:
+                # checking the candidates directly is cheaper than a second index lookup
+                if start is not None:
+                    positions = positions[self.end[positions] >= _as_date(start, end_of_year=False)]
+                if end is not None:
+                    positions = positions[self.start[positions] <= _as_date(end, end_of_year=True)]
+
+        if positions is None:
+            positions = np.arange(len(self))
+
+        if len(attributes) > 0:
+            positions = positions[self.attribute_mask(positions, **attributes)]
+
+        return positions
+
+    def query(self, geometry=None, predicate='intersects', start=None, end=None, uids=None, **attributes):
+        '''
+        Gets the features which satisfy all of the given conditions. See positions() for the parameters.
+
+        @return geopandas dataframe in the in-memory ARTS schema
+        '''
+        return self.data.iloc[self.positions(geometry, predicate, start, end, uids, **attributes)]
+
+    def rows(self, uids):
+        '''
+        Gets all rows with any of the given UIDs, in the order of the data set.
+
+        @param uids - A list of UIDs.
+
+        @return geopandas dataframe with a fresh RangeIndex
+        '''
+        return self.data.iloc[np.unique(self.uid_index.positions(uids))].reset_index(drop=True)
+
+    def intersecting_uids(self, geometries):
+        '''
+        Gets the UIDs of features which overlap each of the given geometries, excluding features which only touch
+        them. This is the bulk equivalent of dataformatting.get_intersecting_uids, get_touching_uids and
+        remove_adjacent_polys.
+
+        @param geometries - A GeoSeries or array of geometries in the CRS of the data set.
+
+        @return list of comma-separated UID strings, one per geometry
+        '''
+        geometries = np.asarray(gpd.GeoSeries(geometries).values)
+        uids = np.array(decode_uids(self.data.UID), dtype=object)
+
+        intersecting = self.sindex.query(geometries, predicate='intersects')
+        touching = self.sindex.query(geometries, predicate='touches')
+
+        touching_uids = [set() for _ in range(len(geometries))]
+        for geometry_idx, data_idx in zip(*touching):
+            touching_uids[geometry_idx].add(uids[data_idx])
+
+        intersections = [[] for _ in range(len(geometries))]
+        order = np.lexsort((intersecting[1], intersecting[0]))
+        for geometry_idx, data_idx in zip(intersecting[0][order], intersecting[1][order]):
+            if uids[data_idx] not in touching_uids[geometry_idx]:
+                intersections[geometry_idx].append(uids[data_idx])
+
+        return [','.join(item) for item in intersections]
@@ -0,0 +1,142 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import warnings
+from .diff import geometry_hashes
+from .schema import decode_uids
+
+
+def normalized_geometry_hashes(geometry, grid_size=0.01):
+    '''
+    Hashes geometries after snapping them to a precision grid and normalizing them (ring orientation, start
+    vertex and part order), so the same polygon digitized with a different vertex order or start point, or with
+    floating point noise below grid_size, gets the same hash.
+
+    @param geometry - A GeoSeries or array of geometries.
+    @param grid_size - Size of the precision grid, in CRS units (meters in EPSG:3413).
+
+    @return numpy array of uint64 hashes
+    '''
+    geometry = np.asarray(gpd.GeoSeries(geometry).values)
+    geometry = shapely.normalize(shapely.set_precision(geometry, grid_size))
+
+    return geometry_hashes(geometry)
+
+
+def _first_pairs(keys):
+    '''
+    Pairs the first row of every group of equal keys with each of the other rows of the group.
+    '''
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    starts = np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]
+    first = order[np.maximum.accumulate(np.where(starts, np.arange(len(keys)), 0))]
+
+    return first[~starts], order[~starts]
+
+
+def _group_codes(*columns):
+    '''
+    Numbers the distinct combinations of the values of several columns.
+    '''
+    return pd.DataFrame({idx: column for idx, column in enumerate(columns)}).groupby(
+        list(range(len(columns))), sort=False, dropna=False).ngroup().values
+
+
+def find_duplicates(data, grid_size=0.01, centroid_tolerance=5, area_tolerance=0.05, min_iou=0.9):
+    '''
+    Finds exact and near-duplicate features in linear time. Only features with the same BaseMapDate are compared, so
+    repeat observations of an RTS or negative box on imagery from another date are not reported. Exact duplicates
+    have the same normalized geometry hash. Near-duplicate candidates share a signature of quantized centroid and
+    log-area (including neighbouring cells of the signature, so features close to a cell edge are not missed), and
+    are only confirmed with an intersection over union check within those buckets. Features which share a UID and
+    BaseMapDate are reported as UID duplicates, whatever their geometry.
+
+    @param data - The ARTS data set, in EPSG:3413.
+    @param grid_size - Size of the precision grid used for exact duplicates, in meters.
+    @param centroid_tolerance - Size of the centroid cells used for near-duplicate candidates, in meters.
+    @param area_tolerance - Relative size of the area bins used for near-duplicate candidates.
+    @param min_iou - Minimum intersection over union for two features to be reported as near-duplicates.
+
+    @return DataFrame with one row per duplicate pair: positions and UIDs of both features, whether the pair is an
+            'exact', 'near' or 'uid' duplicate, and its intersection over union
+    '''
+    geometry = np.asarray(data.geometry.values)
+    uids = np.array(decode_uids(data.UID.reset_index(drop=True)), dtype=object)
+    dates = data.BaseMapDate.astype(str).values if 'BaseMapDate' in data.columns \
+        else np.zeros(len(geometry), dtype=object)
+    date_codes = _group_codes(dates)
+
+    # exact duplicates
+    hashes = normalized_geometry_hashes(geometry, grid_size)
+    exact_a, exact_b = _first_pairs(_group_codes(hashes, date_codes))
+
+    # UIDs which are used more than once for the same BaseMapDate
+    uid_a, uid_b = _first_pairs(_group_codes(uids.astype(str), date_codes))
+
+    # near-duplicate candidates from quantized centroid and area signatures
+    centroids = shapely.centroid(geometry)
+    cell_x = np.floor(shapely.get_x(centroids) / centroid_tolerance).astype(np.int64)
+    cell_y = np.floor(shapely.get_y(centroids) / centroid_tolerance).astype(np.int64)
+    area = shapely.area(geometry)
+    area_bin = np.floor(np.log(np.maximum(area, 1e-9)) / np.log1p(area_tolerance)).astype(np.int64)
+
+    signatures = pd.DataFrame({
+        'row': np.arange(len(geometry)), 'x': cell_x, 'y': cell_y, 'area': area_bin, 'date': date_codes
+    })
+    neighbours = pd.concat([
+        signatures.assign(x=cell_x + dx, y=cell_y + dy, area=area_bin + da)
+        for dx in [-1, 0, 1] for dy in [-1, 0, 1] for da in [-1, 0, 1]
+    ])
+    candidates = pd.merge(signatures, neighbours, on=['x', 'y', 'area', 'date'], suffixes=('_a', '_b'))
+    candidates = candidates[candidates.row_a < candidates.row_b]
+
+    candidates = candidates[['row_a', 'row_b']].drop_duplicates()
+    candidates = candidates[hashes[candidates.row_a.values] != hashes[candidates.row_b.values]]
+
+    row_a = candidates.row_a.values
+    row_b = candidates.row_b.values
+    intersection = shapely.area(shapely.intersection(geometry[row_a], geometry[row_b]))
+    union = area[row_a] + area[row_b] - intersection
+    iou = np.divide(intersection, union, out=np.zeros(len(union)), where=union > 0)
+    is_near = iou >= min_iou
+
+    uid_intersection = shapely.area(shapely.intersection(geometry[uid_a], geometry[uid_b]))
+    uid_union = area[uid_a] + area[uid_b] - uid_intersection
+    uid_iou = np.divide(uid_intersection, uid_union, out=np.zeros(len(uid_union)), where=uid_union > 0)
+
+    duplicates = pd.concat([
+        pd.DataFrame({'row_a': exact_a, 'row_b': exact_b, 'kind': 'exact', 'iou': 1.0}),
+        pd.DataFrame({'row_a': row_a[is_near], 'row_b': row_b[is_near], 'kind': 'near', 'iou': iou[is_near]}),
+        pd.DataFrame({'row_a': uid_a, 'row_b': uid_b, 'kind': 'uid', 'iou': uid_iou})
+    ], ignore_index=True)
+
+    duplicates['UID_a'] = uids[duplicates.row_a.values.astype(np.int64)]
+    duplicates['UID_b'] = uids[duplicates.row_b.values.astype(np.int64)]
+
+    return duplicates[['row_a', 'row_b', 'UID_a', 'UID_b', 'kind', 'iou']]
+
+
+def report_duplicates(data, **kwargs):
+    '''
+    Runs find_duplicates on a data set and warns if any duplicates are found.
+
+    @param data - The ARTS data set.
+    @param kwargs - Passed on to find_duplicates.
+
+    @return DataFrame of duplicate pairs
+    '''
+    duplicates = find_duplicates(data, **kwargs)
+
+    if duplicates.shape[0] > 0:
+        print(duplicates)
+        warnings.warn(
+            '{exact} exact and {near} near-duplicate pairs of features, and {uid} pairs of features with the same UID '
+            'and BaseMapDate were found. See printed rows.'.format(
+                exact=(duplicates.kind == 'exact').sum(), near=(duplicates.kind == 'near').sum(),
+                uid=(duplicates.kind == 'uid').sum()))
+    else:
+        print('No duplicated features were found.')
+
+    return duplicates
@@ -0,0 +1,156 @@
+import hashlib
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from .schema import publishable
+
+
+def geometry_hashes(geometry):
+    '''
+    Hashes the WKB of each geometry, so geometries can be compared without a geometric comparison.
+
+    @param geometry - A GeoSeries or array of geometries.
+
+    @return numpy array of uint64 hashes
+    '''
+    wkb = shapely.to_wkb(np.asarray(gpd.GeoSeries(geometry).values), hex=False)
+
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(value, digest_size=8).digest(), 'little') if value is not None else 0
+         for value in wkb],
+        dtype=np.uint64
+    )
+
+
+def column_hashes(df, columns):
+    '''
+    Hashes each metadata column of a data set. Values are compared as strings, so missing values and empty strings
+    are treated as the same value.
+
+    @param df - A data set in the published schema.
+    @param columns - The columns to hash.
+
+    @return DataFrame of uint64 hashes with one column per metadata column and one for the geometry
+    '''
+    hashes = pd.DataFrame(index=range(df.shape[0]))
+
+    for column in columns:
+        values = df[column].astype(object)
+        values = values.where(values.notna(), '').astype(str)
+        hashes[column] = pd.util.hash_pandas_object(values, index=False).values
+
+    hashes['geometry'] = geometry_hashes(df.geometry)
+
+    return hashes
+
+
+def _pair_rows(old_keys, new_keys, on):
+    '''
+    Pairs rows of two releases on UID and the given key columns. Rows with the same keys are paired in order.
+    '''
+    old_keys = old_keys.assign(occurrence=old_keys.groupby(on).cumcount())
+    new_keys = new_keys.assign(occurrence=new_keys.groupby(on).cumcount())
+
+    return pd.merge(old_keys, new_keys, how='inner', on=on + ['occurrence'], suffixes=('_old', '_new'))
+
+
+def diff_releases(old_data, new_data):
+    '''
+    Compares two releases of the ARTS data set. Rows are joined on UID; several rows can share a UID (e.g. repeat
+    RTS), so rows within a UID are first paired on identical content and the rest are paired by BaseMapDate order.
+    All comparisons are done on hashes of the metadata values and of the WKB of the geometries.
+
+    @param old_data - The older release, as a file path or geopandas dataframe.
+    @param new_data - The newer release, as a file path or geopandas dataframe.
+
+    @return dict with 'added' and 'removed' (geopandas dataframes of rows only in one release), 'modified'
+            (DataFrame with UID, column, old and new value for each changed value) and 'added_columns' and
+            'removed_columns' (lists of column names)
+    '''
+    if not isinstance(old_data, pd.DataFrame):
+        old_data = gpd.read_file(old_data)
+    if not isinstance(new_data, pd.DataFrame):
+        new_data = gpd.read_file(new_data)
+
+    old_data = publishable(old_data).reset_index(drop=True)
+    new_data = publishable(new_data).reset_index(drop=True)
+
+    columns = [item for item in old_data.columns if item in new_data.columns and item != 'geometry']
+    old_hashes = column_hashes(old_data, columns)
+    new_hashes = column_hashes(new_data, columns)
+
+    old_keys = pd.DataFrame({
+        'UID': old_data.UID.values,
+        'BaseMapDate': old_data.BaseMapDate.values,
+        'row_hash': pd.util.hash_pandas_object(old_hashes, index=False).values,
+        'row': np.arange(old_data.shape[0])
+    })
+    new_keys = pd.DataFrame({
+        'UID': new_data.UID.values,
+        'BaseMapDate': new_data.BaseMapDate.values,
+        'row_hash': pd.util.hash_pandas_object(new_hashes, index=False).values,
+        'row': np.arange(new_data.shape[0])
+    })
+
+    # unchanged rows first, then pair the remaining rows of each UID in BaseMapDate order
+    unchanged = _pair_rows(old_keys, new_keys, ['UID', 'row_hash'])
+    old_left = old_keys[~old_keys.row.isin(unchanged.row_old)].sort_values(['UID', 'BaseMapDate', 'row'])
+    new_left = new_keys[~new_keys.row.isin(unchanged.row_new)].sort_values(['UID', 'BaseMapDate', 'row'])
+    changed = _pair_rows(old_left, new_left, ['UID'])
+
+    removed = old_data.iloc[np.sort(old_left.row[~old_left.row.isin(changed.row_old)].values)]
+    added = new_data.iloc[np.sort(new_left.row[~new_left.row.isin(changed.row_new)].values)]
+
+    modified = []
+    for column in columns + ['geometry']:
+        is_changed = (
+            old_hashes[column].values[changed.row_old.values] != new_hashes[column].values[changed.row_new.values]
+        )
+        pairs = changed[is_changed]
+
+        if column == 'geometry':
+            old_values = ['{:016x}'.format(value) for value in old_hashes[column].values[pairs.row_old.values]]
+            new_values = ['{:016x}'.format(value) for value in new_hashes[column].values[pairs.row_new.values]]
+        else:
+            old_values = list(old_data[column].values[pairs.row_old.values])
+            new_values = list(new_data[column].values[pairs.row_new.values])
+
+        modified.append(pd.DataFrame({
+            'UID': pairs.UID.values,
+            'column': column,
+            'old': old_values,
+            'new': new_values
+        }))
+
+    modified = pd.concat(modified, ignore_index=True)
+
+    return {
+        'added': added,
+        'removed': removed,
+        'modified': modified,
+        'added_columns': [item for item in new_data.columns if item not in old_data.columns],
+        'removed_columns': [item for item in old_data.columns if item not in new_data.columns]
+    }
+
+
+def summarize_diff(diff):
+    '''
+    Prints a summary of a release diff in the style of the release notes.
+
+    @param diff - Output of diff_releases.
+    '''
+    for creator, count in diff['added'].groupby('CreatorLab').size().items():
+        print('{count} entries were added from CreatorLab={creator}.'.format(count=count, creator=repr(creator)))
+
+    for creator, count in diff['removed'].groupby('CreatorLab').size().items():
+        print('{count} entries were removed from CreatorLab={creator}.'.format(count=count, creator=repr(creator)))
+
+    for column, count in diff['modified'].groupby('column').UID.nunique().items():
+        print('{column} was changed in {count} entries.'.format(column=column, count=count))
+
+    for column in diff['added_columns']:
+        print('The {column} column was added.'.format(column=column))
+
+    for column in diff['removed_columns']:
+        print('The {column} column was removed.'.format(column=column))
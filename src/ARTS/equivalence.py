@@ -0,0 +1,351 @@
+'''
+Differential checks between the reference implementations in reference.py and the current (accelerated)
+implementations, on seeded synthetic data sets:
+
+    python -m ARTS.equivalence --seeds 10
+
+Every run compares the outputs column by column and reports the speedup of each engine.
+'''
+import argparse
+import contextlib
+import io
+import random
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pathlib import Path
+from . import autosplit, dataformatting, reference
+from .dataset import ARTSDataset
+
+
+# origin of the synthetic data, in EPSG:3413
+ORIGIN = (2000000, 860000)
+
+OVERLAP_COLUMNS = ['RepeatRTS', 'MergedRTS', 'SplitRTS', 'StabilizedRTS', 'AccidentalOverlap', 'UnknownRelationship']
+
+
+def _basemap_date(rng, year, multi_year):
+    # the pipeline expects 'start,end' for every feature; the range is either within one season or across years
+    start = '{year}-{month:02d}-01'.format(year=year, month=int(rng.integers(5, 8)))
+    end = '{year}-09-30'.format(year=year + int(rng.integers(1, 3)) if multi_year else year)
+
+    return start + ',' + end
+
+
+def _features(geometries, rng, train_class, years, multi_year, uids):
+    n = len(geometries)
+    data = gpd.GeoDataFrame({
+        'CentroidLat': np.zeros(n),
+        'CentroidLon': np.zeros(n),
+        'RegionName': rng.choice(['Yamal-Gydan', 'Banks Island', 'Peel Plateau'], n),
+        'CreatorLab': rng.choice(['Rodenhizer', 'Nitze', 'Yang'], n),
+        'BaseMapDate': [_basemap_date(rng, year, item) for year, item in zip(years, multi_year)],
+        'BaseMapSource': rng.choice(['WorldView-2', 'PlanetScope', 'Sentinel-2'], n),
+        'BaseMapResolution': rng.choice([0.5, 3.0, 10.0], n),
+        'TrainClass': train_class,
+        'LabelType': np.where(np.asarray(train_class) == 'Negative', 'BoundingBox', 'Polygon'),
+        'UID': uids
+    }, geometry=list(geometries), crs='EPSG:3413')
+
+    centroids = data.centroid.to_crs(4326)
+    data['CentroidLat'] = centroids.y.round(5)
+    data['CentroidLon'] = centroids.x.round(5)
+
+    return data
+
+
+def _slump(rng, x, y, radius):
+    # irregular polygon around a point
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 12))
+    radii = radius * rng.uniform(0.6, 1.2, 12)
+
+    return shapely.Polygon(np.stack([x + radii * np.cos(angles), y + radii * np.sin(angles)], axis=1)).buffer(0)
+
+
+def synthetic_data(seed, n_sites=100, extent=20000):
+    '''
+    Generates a synthetic main data set and contribution with the relationships the pipeline has to handle: repeat
+    RTS (several rows with one UID), negative bounding boxes overlapping other negatives and containing positives,
+    polygons which only touch, chains of overlapping polygons within the contribution, and BaseMapDate ranges within
+    one season or across several years.
+
+    @param seed - Seed of the random number generator. The same seed always gives the same data.
+    @param n_sites - Number of RTS sites in the main data set.
+    @param extent - Side length of the area of the sites, in meters.
+
+    @return (main_data, new_data) geopandas dataframes in EPSG:3413
+    '''
+    rng = np.random.default_rng(seed)
+
+    def make_uids(n):
+        return [str(uuid.uuid5(uuid.NAMESPACE_DNS, name='synthetic-' + str(seed) + '-' + str(int(value))))
+                for value in rng.integers(0, 2 ** 62, n)]
+
+    # main data set: RTS sites, some digitized in several years, and negative boxes
+    x = ORIGIN[0] + rng.uniform(0, extent, n_sites)
+    y = ORIGIN[1] + rng.uniform(0, extent, n_sites)
+    site_uids = make_uids(n_sites)
+    radius = rng.uniform(20, 120, n_sites)
+
+    rows = []
+    for idx in range(n_sites):
+        for version in range(int(rng.choice([1, 1, 2, 3]))):
+            rows.append((_slump(rng, x[idx], y[idx], radius[idx] * (1 + 0.2 * version)), 'Positive',
+                         2018 + 2 * version + int(rng.integers(0, 2)), site_uids[idx]))
+
+    n_boxes = max(n_sites // 5, 1)
+    box_x = ORIGIN[0] + rng.uniform(0, extent, n_boxes)
+    box_y = ORIGIN[1] + rng.uniform(0, extent, n_boxes)
+    box_size = rng.uniform(200, 600, n_boxes)
+    for idx, uid in enumerate(make_uids(n_boxes)):
+        rows.append((shapely.box(box_x[idx], box_y[idx], box_x[idx] + box_size[idx], box_y[idx] + box_size[idx]),
+                     'Negative', int(rng.integers(2017, 2023)), uid))
+
+    geometries, train_class, years, uids = zip(*rows)
+    main_data = _features(geometries, rng, list(train_class), years, rng.random(len(rows)) < 0.3, list(uids))
+    main_data['ContributionDate'] = '2023-09-01'
+
+    # contribution
+    rows = []
+
+    # repeat RTS at existing sites
+    for idx in rng.choice(n_sites, n_sites // 5, replace=False):
+        rows.append((_slump(rng, x[idx], y[idx], radius[idx] * 1.5), 'Positive', 2023))
+
+    # polygons which only touch an existing negative box, and each other
+    for idx in rng.choice(n_boxes, max(n_boxes // 3, 1), replace=False):
+        minx, miny, maxx, maxy = main_data.geometry.values[len(main_data) - n_boxes + idx].bounds
+        rows.append((shapely.box(maxx, miny, maxx + 100, miny + 100), 'Positive', 2023))
+        rows.append((shapely.box(maxx + 100, miny, maxx + 200, miny + 100), 'Positive', 2023))
+
+    # negative boxes over existing negatives, with positives within them
+    for idx in rng.choice(n_boxes, max(n_boxes // 3, 1), replace=False):
+        minx, miny, maxx, maxy = main_data.geometry.values[len(main_data) - n_boxes + idx].bounds
+        rows.append((shapely.box(minx + 50, miny + 50, maxx + 50, maxy + 50), 'Negative', 2023))
+        rows.append((_slump(rng, minx + 150, miny + 150, 40), 'Positive', 2023))
+
+    # chains of overlapping polygons within the contribution
+    for _ in range(max(n_sites // 20, 1)):
+        chain_x = ORIGIN[0] + rng.uniform(0, extent)
+        chain_y = ORIGIN[1] + rng.uniform(0, extent)
+        for link in range(int(rng.integers(2, 5))):
+            rows.append((_slump(rng, chain_x + 60 * link, chain_y, 45), 'Positive', 2023))
+
+    # isolated new RTS
+    for _ in range(n_sites // 10):
+        rows.append((_slump(rng, ORIGIN[0] + rng.uniform(0, extent), ORIGIN[1] + rng.uniform(0, extent), 50),
+                     'Positive', 2023))
+
+    geometries, train_class, years = zip(*rows)
+    new_data = _features(geometries, rng, list(train_class), years, rng.random(len(rows)) < 0.3, make_uids(len(rows)))
+
+    return main_data, new_data
+
+
+def overlapping_rows(new_data):
+    '''
+    Selects the rows of the output of check_intersections which overlap other features and adds the empty
+    relationship columns, as check_intersections does before classifying negatives.
+    '''
+    overlapping_data = new_data[(new_data['Intersections'].str.len() > 0) |
+                                (new_data['SelfIntersections'].str.len() > 0)].copy()
+
+    for column in OVERLAP_COLUMNS:
+        if column not in overlapping_data.columns:
+            overlapping_data[column] = [''] * overlapping_data.shape[0]
+
+    return overlapping_data
+
+
+def _normalized(values):
+    '''
+    Converts a column to comparable values: geometries to WKB, and missing values (None, NaN, NaT) to None.
+    '''
+    if isinstance(values, gpd.GeoSeries):
+        return list(shapely.to_wkb(np.asarray(values.values)))
+
+    return [None if item is None or (not isinstance(item, (list, tuple, np.ndarray)) and pd.isna(item))
+            else item for item in values.astype(object)]
+
+
+def compare_frames(expected, actual):
+    '''
+    Compares two data frames column by column, ignoring the index.
+
+    @param expected - Output of the reference implementation.
+    @param actual - Output of the current implementation.
+
+    @return list of differences, as strings. Empty if the data frames are equivalent.
+    '''
+    differences = []
+
+    missing = [column for column in expected.columns if column not in actual.columns]
+    extra = [column for column in actual.columns if column not in expected.columns]
+    if len(missing) > 0:
+        differences.append('missing columns: ' + repr(missing))
+    if len(extra) > 0:
+        differences.append('extra columns: ' + repr(extra))
+
+    if expected.shape[0] != actual.shape[0]:
+        differences.append('{expected} rows expected, {actual} found'.format(
+            expected=expected.shape[0], actual=actual.shape[0]))
+        return differences
+
+    for column in [column for column in expected.columns if column in actual.columns]:
+        expected_values = _normalized(expected[column].reset_index(drop=True))
+        actual_values = _normalized(actual[column].reset_index(drop=True))
+        mismatches = [idx for idx, (a, b) in enumerate(zip(expected_values, actual_values)) if not a == b]
+        if len(mismatches) > 0:
+            differences.append('{column}: {count} rows differ, e.g. row {row}: {expected} != {actual}'.format(
+                column=column, count=len(mismatches), row=mismatches[0],
+                expected=repr(expected_values[mismatches[0]]), actual=repr(actual_values[mismatches[0]])))
+
+    return differences
+
+
+def _timed(func, *args, **kwargs):
+    # the pipeline functions print progress, which is not part of the comparison
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()), \
+            warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        result = func(*args, **kwargs)
+
+    return result, time.perf_counter() - start
+
+
+def _edited_file(overlapping_data, directory, seed):
+    '''
+    Simulates the manual edit of the overlapping file: positives that intersect a feature with an earlier
+    BaseMapDate are marked as repeats of the first intersecting UID.
+    '''
+    edited = overlapping_data.copy()
+    rng = np.random.default_rng(seed)
+
+    for column in ['RepeatNegative', 'NewRTS', 'FalseNegative']:
+        if column not in edited.columns:
+            edited[column] = ''
+
+    repeat = (edited.TrainClass == 'Positive') & (edited.Intersections.str.len() > 0) & \
+        (rng.random(edited.shape[0]) < 0.8)
+    edited.loc[repeat, 'RepeatRTS'] = [item.split(',')[0] for item in edited.Intersections[repeat]]
+
+    filepath = Path(directory) / 'edited.geojson'
+    edited.to_file(filepath)
+
+    return filepath
+
+
+def run_case(seed, n_sites=100, tile_size=256):
+    '''
+    Runs the reference and current implementations of every engine on one synthetic data set.
+
+    @param seed - Seed of the synthetic data set.
+    @param n_sites - Number of RTS sites in the main data set.
+    @param tile_size - Tile size for split_with_buffer.
+
+    @return DataFrame with one row per engine: run times, speedup and differences
+    '''
+    main_data, new_data = synthetic_data(seed, n_sites)
+    results = []
+
+    def record(engine, expected, reference_time, actual, current_time):
+        differences = compare_frames(expected, actual)
+        results.append({
+            'seed': seed, 'engine': engine, 'rows': expected.shape[0], 'reference_s': reference_time,
+            'current_s': current_time, 'speedup': reference_time / max(current_time, 1e-9),
+            'equivalent': len(differences) == 0, 'differences': differences
+        })
+
+    # check_intersections, with the indexed main data set
+    expected, reference_time = _timed(reference.check_intersections, new_data.copy(), main_data, None, True)
+    actual, current_time = _timed(
+        lambda: dataformatting.check_intersections(new_data.copy(), ARTSDataset(main_data), None, True))
+    record('check_intersections', expected, reference_time, actual, current_time)
+
+    # classify_negatives, on the overlapping rows of the reference output
+    overlapping_data = overlapping_rows(expected)
+    if overlapping_data.shape[0] > 0:
+        negatives, reference_time = _timed(reference.classify_negatives, overlapping_data.copy(), main_data)
+        actual, current_time = _timed(
+            lambda: dataformatting.classify_negatives(overlapping_data.copy(), ARTSDataset(main_data)))
+        record('classify_negatives', negatives, reference_time, actual, current_time)
+        overlapping_data = overlapping_data.set_axis(negatives.index).join(negatives)
+
+    # merge_data, with a simulated manual edit
+    with tempfile.TemporaryDirectory() as directory:
+        edited_file = _edited_file(overlapping_data, directory, seed) if overlapping_data.shape[0] > 0 \
+            else Path(directory) / 'missing.geojson'
+        merged, reference_time = _timed(reference.merge_data, expected.copy(), edited_file)
+        actual, current_time = _timed(dataformatting.merge_data, expected.copy(), edited_file)
+        record('merge_data', merged, reference_time, actual, current_time)
+
+    # split_with_buffer, with the same random state
+    split_data = main_data[['geometry']].copy()
+    split_data['ID'] = range(split_data.shape[0])
+    split_data['Long'] = main_data.CentroidLon
+    split_data['Lat'] = main_data.CentroidLat
+
+    random.seed(seed)
+    split, reference_time = _timed(
+        reference.split_with_buffer, split_data.copy(), ['train', 'val', 'test'], [0.8, 0.1, 0.1], tile_size)
+    random.seed(seed)
+    actual, current_time = _timed(
+        autosplit.split_with_buffer, split_data.copy(), ['train', 'val', 'test'], [0.8, 0.1, 0.1], tile_size)
+    record('split_with_buffer', split, reference_time, actual, current_time)
+
+    return pd.DataFrame(results)
+
+
+def run_equivalence(seeds=range(5), n_sites=100, tile_size=256):
+    '''
+    Runs run_case for several seeds and prints a report.
+
+    @param seeds - Seeds of the synthetic data sets.
+    @param n_sites - Number of RTS sites in each main data set.
+    @param tile_size - Tile size for split_with_buffer.
+
+    @return DataFrame with one row per seed and engine
+    '''
+    results = pd.concat([run_case(seed, n_sites, tile_size) for seed in seeds], ignore_index=True)
+
+    summary = results.groupby('engine', sort=False).agg(
+        cases=('seed', 'count'), equivalent=('equivalent', 'sum'), reference_s=('reference_s', 'sum'),
+        current_s=('current_s', 'sum'))
+    summary['speedup'] = summary.reference_s / summary.current_s
+    print(summary.round(3).to_string())
+
+    for _, row in results[~results.equivalent].iterrows():
+        print('seed {seed}, {engine}:'.format(seed=row.seed, engine=row.engine))
+        for difference in row.differences:
+            print('    ' + difference)
+
+    if results.equivalent.all():
+        print('All engines match the reference implementations.')
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m ARTS.equivalence',
+        description='Compares the current pipeline with the reference implementations on synthetic data.')
+    parser.add_argument('--seeds', type=int, default=5, help='Number of synthetic data sets.')
+    parser.add_argument('--first-seed', type=int, default=0, help='Seed of the first synthetic data set.')
+    parser.add_argument('--sites', type=int, default=100, help='Number of RTS sites per main data set.')
+    parser.add_argument('--tile-size', type=float, default=256, help='Tile size for split_with_buffer, in meters.')
+    args = parser.parse_args(argv)
+
+    results = run_equivalence(range(args.first_seed, args.first_seed + args.seeds), args.sites, args.tile_size)
+
+    return 0 if results.equivalent.all() else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
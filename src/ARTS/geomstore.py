@@ -0,0 +1,277 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+import pyarrow.compute as pc
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from .release import hilbert_keys
+from .schema import publishable
+
+
+# number of children of each node of the packed R-tree
+NODE_SIZE = 16
+
+
+def pack_rtree(bounds, node_size=NODE_SIZE):
+    '''
+    Builds the node boxes of a packed R-tree. Each node covers node_size consecutive boxes of the level below, so the
+    tree is stored as flat arrays, from the leaves up to the root, and needs no pointers.
+
+    @param bounds - (n, 4) array of leaf boxes, already sorted so that consecutive boxes are close to each other.
+    @param node_size - Number of children of each node.
+
+    @return (nodes, level_offsets): (m, 4) array of the boxes of all levels, and the position of the first box of each
+            level in nodes, with the number of boxes as the last value
+    '''
+    levels = [np.asarray(bounds, dtype=np.float64).reshape(-1, 4)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        n_nodes = -(-len(level) // node_size)
+        padded = np.full((n_nodes * node_size, 4), np.nan)
+        padded[:len(level)] = level
+        padded = padded.reshape(n_nodes, node_size, 4)
+
+        levels.append(np.column_stack([
+            np.nanmin(padded[:, :, 0], axis=1), np.nanmin(padded[:, :, 1], axis=1),
+            np.nanmax(padded[:, :, 2], axis=1), np.nanmax(padded[:, :, 3], axis=1)
+        ]))
+
+    level_offsets = np.zeros(len(levels) + 1, dtype=np.int64)
+    np.cumsum([len(level) for level in levels], out=level_offsets[1:])
+
+    return np.concatenate(levels), level_offsets
+
+
+def write_store(data, directory):
+    '''
+    Saves a data set as a geometry store: the WKB of all geometries in one contiguous buffer with an offset array,
+    the bounding box of each geometry, a packed R-tree over the rows with a geometry in Hilbert curve order, and the
+    metadata columns as an uncompressed Arrow file. All of these can be memory-mapped, so worker processes share the
+    pages through the OS instead of receiving pickled copies or building their own index. Missing geometries are
+    saved as zero-length WKB.
+
+    @param data - The ARTS data set.
+    @param directory - The directory in which to save the store.
+
+    @return GeometryStore
+    '''
+    directory = Path(directory)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    geometry = np.asarray(data.geometry.values)
+    wkb = shapely.to_wkb(geometry, hex=False)
+    lengths = np.array([0 if value is None else len(value) for value in wkb], dtype=np.int64)
+
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    with open(directory / 'geometry.wkb', 'wb') as file:
+        file.writelines(value for value in wkb if value is not None)
+
+    # rows with a geometry, sorted along a Hilbert curve so that neighbouring boxes are packed together in the tree
+    bounds = shapely.bounds(geometry)
+    indexed = np.flatnonzero(~shapely.is_missing(geometry) & ~shapely.is_empty(geometry))
+    order = indexed[np.argsort(hilbert_keys(geometry[indexed]), kind='stable')]
+    nodes, level_offsets = pack_rtree(bounds[order])
+
+    np.save(directory / 'offsets.npy', offsets)
+    np.save(directory / 'bounds.npy', bounds)
+    np.save(directory / 'order.npy', order.astype(np.int64))
+    np.save(directory / 'nodes.npy', nodes)
+    np.save(directory / 'levels.npy', level_offsets)
+
+    attributes = pd.DataFrame(publishable(data).drop(columns=data.geometry.name))
+    with pa.OSFile(str(directory / 'attributes.arrow'), 'wb') as sink:
+        table = pa.Table.from_pandas(attributes, preserve_index=False)
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    with open(directory / 'store.json', 'w') as file:
+        json.dump({'crs': data.crs.to_string() if data.crs is not None else None, 'count': len(wkb),
+                   'node_size': NODE_SIZE}, file)
+
+    return GeometryStore(directory)
+
+
+class GeometryStore:
+    '''
+    Read-only, memory-mapped view of a store written with write_store. Geometries are only decoded when they are
+    accessed. Spatial queries walk the memory-mapped packed R-tree from the root down, so a query only touches the
+    nodes whose boxes intersect it and no process builds an index of its own. Pickling a store only pickles its
+    directory, so it can be passed to worker processes cheaply.
+    '''
+
+    def __init__(self, directory):
+        '''
+        @param directory - The directory of the store.
+        '''
+        self.directory = Path(directory)
+
+        with open(self.directory / 'store.json') as file:
+            metadata = json.load(file)
+
+        self.crs = metadata['crs']
+        self.node_size = metadata['node_size']
+        self.offsets = np.load(self.directory / 'offsets.npy', mmap_mode='r')
+        self.bounds = np.load(self.directory / 'bounds.npy', mmap_mode='r')
+        self.order = np.load(self.directory / 'order.npy', mmap_mode='r')
+        self.nodes = np.load(self.directory / 'nodes.npy', mmap_mode='r')
+        self.level_offsets = np.load(self.directory / 'levels.npy')
+
+        if self.offsets[-1] > 0:
+            self.wkb = np.memmap(self.directory / 'geometry.wkb', dtype=np.uint8, mode='r')
+        else:
+            self.wkb = np.zeros(0, dtype=np.uint8)
+
+        self.attributes = pa.ipc.open_file(pa.memory_map(str(self.directory / 'attributes.arrow'))).read_all()
+
+    def __getstate__(self):
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def geometries(self, positions=None):
+        '''
+        Decodes the geometries at the given positions.
+
+        @param positions - Optional array of row positions. Defaults to all rows.
+
+        @return numpy array of shapely geometries, with None for missing geometries
+        '''
+        positions = np.arange(len(self)) if positions is None else np.asarray(positions, dtype=np.int64)
+
+        return shapely.from_wkb([
+            self.wkb[self.offsets[position]:self.offsets[position + 1]].tobytes()
+            if self.offsets[position + 1] > self.offsets[position] else None
+            for position in positions
+        ])
+
+    def bbox_positions(self, bbox):
+        '''
+        Gets the rows whose bounding box intersects a bounding box, without decoding any geometry.
+
+        @param bbox - (minx, miny, maxx, maxy) tuple in the CRS of the store.
+
+        @return sorted numpy array of row positions
+        '''
+        minx, miny, maxx, maxy = bbox
+        n_levels = len(self.level_offsets) - 1
+
+        candidates = np.arange(self.level_offsets[-1] - self.level_offsets[-2])
+        for level in range(n_levels - 1, -1, -1):
+            boxes = self.nodes[self.level_offsets[level] + candidates]
+            candidates = candidates[
+                (boxes[:, 0] <= maxx) & (boxes[:, 2] >= minx) & (boxes[:, 1] <= maxy) & (boxes[:, 3] >= miny)
+            ]
+
+            if level > 0:
+                # children of the matching nodes on the level below
+                candidates = (candidates[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+                candidates = candidates[candidates < self.level_offsets[level] - self.level_offsets[level - 1]]
+
+        return np.sort(self.order[candidates])
+
+    def query(self, geometry, predicate='intersects'):
+        '''
+        Gets the rows whose geometry satisfies a predicate with the query geometry. Only the geometries whose bounding
+        box intersects the query geometry are decoded.
+
+        @param geometry - A shapely geometry in the CRS of the store.
+        @param predicate - Name of a shapely binary predicate, e.g. 'intersects', 'touches' or 'within'.
+
+        @return numpy array of row positions
+        '''
+        positions = self.bbox_positions(geometry.bounds)
+        candidates = self.geometries(positions)
+
+        return positions[getattr(shapely, predicate)(candidates, geometry)]
+
+    def uid_positions(self, uids):
+        '''
+        Gets the rows with any of the given UIDs, without decoding any geometry.
+
+        @param uids - A list of UID strings.
+
+        @return sorted numpy array of row positions
+        '''
+        mask = pc.is_in(self.attributes.column('UID'), value_set=pa.array(list(uids), type=pa.string()))
+
+        return np.flatnonzero(mask.to_numpy(zero_copy_only=False))
+
+    def intersecting_uids(self, geometries):
+        '''
+        Gets the UIDs of features which overlap each of the given geometries, excluding features which only touch
+        them. This is the equivalent of dataset.ARTSDataset.intersecting_uids, decoding only the geometries whose
+        bounding box intersects a query geometry.
+
+        @param geometries - A GeoSeries or array of geometries in the CRS of the store.
+
+        @return list of comma-separated UID strings, one per geometry
+        '''
+        uid = self.attributes.column('UID')
+
+        intersections = []
+        for geometry in np.asarray(gpd.GeoSeries(geometries).values):
+            if geometry is None or geometry.is_empty:
+                intersections.append('')
+                continue
+
+            positions = self.bbox_positions(geometry.bounds)
+            candidates = self.geometries(positions)
+            positions = positions[shapely.intersects(candidates, geometry) & ~shapely.touches(candidates, geometry)]
+            intersections.append(','.join(uid.take(pa.array(positions, type=pa.int64())).to_pylist()))
+
+        return intersections
+
+    def to_geodataframe(self, positions=None, columns=None):
+        '''
+        Builds a GeoDataFrame from some or all of the rows of the store.
+
+        @param positions - Optional array of row positions. Defaults to all rows.
+        @param columns - Optional list of metadata columns. Defaults to all columns.
+
+        @return geopandas dataframe
+        '''
+        attributes = self.attributes if columns is None else self.attributes.select(columns)
+
+        if positions is not None:
+            attributes = attributes.take(pa.array(np.asarray(positions, dtype=np.int64)))
+
+        return gpd.GeoDataFrame(
+            attributes.to_pandas(), geometry=self.geometries(positions), crs=self.crs
+        )
+
+
+def _intersecting_uids(store, wkb):
+    return store.intersecting_uids(shapely.from_wkb(wkb))
+
+
+def intersecting_uids(store, geometries, max_workers=None, chunk_size=1000):
+    '''
+    Gets the UIDs of features of a store which overlap each of the given geometries, excluding features which only
+    touch them, in chunks across a process pool. Only the directory of the store and the WKB of each chunk are sent
+    to the workers.
+
+    @param store - A GeometryStore.
+    @param geometries - A GeoSeries or array of geometries in the CRS of the store.
+    @param max_workers - Number of worker processes. Defaults to the number of CPUs.
+    @param chunk_size - Number of geometries per chunk.
+
+    @return list of comma-separated UID strings, one per geometry
+    '''
+    wkb = shapely.to_wkb(np.asarray(gpd.GeoSeries(geometries).values), hex=False)
+    chunks = [wkb[start:start + chunk_size] for start in range(0, len(wkb), chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(_intersecting_uids, [store] * len(chunks), chunks)
+
+        return [item for result in results for item in result]
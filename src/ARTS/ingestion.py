@@ -0,0 +1,215 @@
+import io
+import re
+import zipfile
+import pandas as pd
+import geopandas as gpd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+
+VECTOR_EXTENSIONS = ['.shp', '.geojson', '.json', '.gpkg', '.kml', '.fgb']
+TABULAR_EXTENSIONS = ['.csv', '.tab', '.txt', '.xlsx', '.xls']
+# .txt files in archives are mostly README or summary files, so they are only read when given explicitly
+DISCOVERED_EXTENSIONS = VECTOR_EXTENSIONS + [extension for extension in TABULAR_EXTENSIONS if extension != '.txt']
+
+
+def _split_member(member):
+    '''
+    Splits a member path into the archives it is nested in and the final member, e.g.
+    'RTS_Barth_etal/BL.zip/BL/BL_RTS.shp' -> (['RTS_Barth_etal/BL.zip'], 'BL/BL_RTS.shp').
+    '''
+    parts = re.split(r'(?<=\.zip)/', member, flags=re.IGNORECASE)
+    return parts[:-1], parts[-1]
+
+
+def gdal_path(path, member=None):
+    '''
+    Builds the GDAL virtual file system path of a file, or of a member of a (possibly nested) zip archive, so that
+    it can be read without extracting the archive.
+
+    @param path - The file path of the source file or archive.
+    @param member - Optional path of the file within the archive. Nested archives are separated by '/', e.g.
+                    'RTS_Barth_etal/BL.zip/BL/BL_RTS.shp'.
+
+    @return path that can be passed to geopandas.read_file
+    '''
+    if member is None:
+        return str(path)
+
+    archives, member = _split_member(member)
+
+    vsi_path = '/vsizip/' + str(path)
+    for archive in archives:
+        vsi_path = '/vsizip/{' + vsi_path + '/' + archive + '}'
+
+    return vsi_path + '/' + member
+
+
+def open_member(path, member):
+    '''
+    Opens a member of a (possibly nested) zip archive as a file object. Nested archives are read into memory; nothing
+    is written to disk.
+
+    @param path - The file path of the archive.
+    @param member - Path of the file within the archive.
+
+    @return file object
+    '''
+    archives, member = _split_member(member)
+
+    archive = zipfile.ZipFile(path)
+    for inner in archives:
+        archive = zipfile.ZipFile(io.BytesIO(archive.read(inner)))
+
+    return archive.open(member)
+
+
+def archive_members(path):
+    '''
+    Lists the vector and tabular files within a zip archive, including those in nested zip archives. Tab-separated
+    .txt tables are not listed; pass them to read_source as an explicit member.
+
+    @param path - The file path of the archive.
+
+    @return list of member paths which can be passed to read_source
+    '''
+    def list_members(archive, prefix):
+        members = []
+        for name in archive.namelist():
+            extension = Path(name).suffix.lower()
+            if extension == '.zip':
+                members = members + list_members(zipfile.ZipFile(io.BytesIO(archive.read(name))), prefix + name + '/')
+            elif extension in DISCOVERED_EXTENSIONS:
+                members.append(prefix + name)
+        return members
+
+    return list_members(zipfile.ZipFile(path), '')
+
+
+def read_pangaea_tab(file):
+    '''
+    Reads a PANGAEA .tab file. The metadata header between '/*' and '*/' is skipped and the rest is read as a
+    tab-separated table.
+
+    @param file - A file path or file object.
+
+    @return pandas DataFrame
+    '''
+    if isinstance(file, (str, Path)):
+        file = open(file, 'rb')
+
+    with file:
+        text = file.read().decode('utf-8')
+
+    if text.lstrip().startswith('/*'):
+        text = text[text.index('*/') + 2:].lstrip('\r\n')
+
+    return pd.read_csv(io.StringIO(text), sep='\t')
+
+
+def read_table(path, member=None, sheet_name=0):
+    '''
+    Reads a tabular source (.csv, .tab, .txt, .xlsx or .xls), from disk or from within a zip archive.
+
+    @param path - The file path of the source file or archive.
+    @param member - Optional path of the file within the archive.
+    @param sheet_name - Sheet to read from spreadsheets.
+
+    @return pandas DataFrame
+    '''
+    name = member if member is not None else str(path)
+    extension = Path(name).suffix.lower()
+
+    def source_file():
+        return open_member(path, member) if member is not None else open(path, 'rb')
+
+    if extension == '.tab':
+        return read_pangaea_tab(source_file())
+
+    with source_file() as file:
+        if extension in ['.xlsx', '.xls']:
+            return pd.read_excel(io.BytesIO(file.read()), sheet_name=sheet_name)
+        elif extension == '.txt':
+            return pd.read_csv(file, sep='\t')
+        else:
+            return pd.read_csv(file)
+
+
+def read_source(source):
+    '''
+    Reads one raw source into a GeoDataFrame in EPSG:3413 and applies its field map.
+
+    A source is a dict with:
+        'path' - The file path of the source file or archive (required).
+        'member' - Path of the file within the archive, if path is an archive.
+        'layer' - Layer to read from multi-layer vector files.
+        'x', 'y' - Coordinate columns of tabular sources, e.g. 'Longitude' and 'Latitude'.
+        'crs' - CRS of the coordinate columns. Defaults to 'EPSG:4326'.
+        'sheet_name' - Sheet to read from spreadsheets.
+        'field_map' - Dict of source column names to ARTS column names. Only mapped columns are kept, if given.
+        'constants' - Dict of ARTS column names to values that apply to every feature, e.g. CreatorLab.
+
+    @param source - The source dict.
+
+    @return geopandas dataframe in EPSG:3413
+    '''
+    path = source['path']
+    member = source.get('member')
+    name = member if member is not None else str(path)
+    extension = Path(name).suffix.lower()
+
+    if extension in TABULAR_EXTENSIONS:
+        if 'x' not in source or 'y' not in source:
+            raise ValueError(
+                '{name} is a table. Provide the coordinate columns as x and y.'.format(name=repr(name)))
+
+        table = read_table(path, member, source.get('sheet_name', 0))
+        for field in [source['x'], source['y']]:
+            if field not in table.columns:
+                raise ValueError(
+                    '{field} is missing from {name}. Did you specify the coordinate columns correctly?'
+                    .format(field=repr(field), name=repr(name)))
+
+        data = gpd.GeoDataFrame(
+            table.drop([source['x'], source['y']], axis=1),
+            geometry=gpd.points_from_xy(table[source['x']], table[source['y']]),
+            crs=source.get('crs', 'EPSG:4326')
+        )
+
+    elif extension in VECTOR_EXTENSIONS:
+        data = gpd.read_file(gdal_path(path, member), layer=source.get('layer'))
+
+    else:
+        raise ValueError('{name} is not a supported file format.'.format(name=repr(name)))
+
+    if data.crs != 'EPSG:3413':
+        data = data.to_crs('EPSG:3413')
+
+    field_map = source.get('field_map')
+    if field_map is not None:
+        missing = [field for field in field_map if field not in data.columns]
+        if len(missing) > 0:
+            raise ValueError('{fields} are missing from {name}.'.format(fields=repr(missing), name=repr(name)))
+
+        data = data.rename(columns=field_map)[list(field_map.values()) + ['geometry']]
+
+    for field, value in source.get('constants', {}).items():
+        data[field] = value
+
+    return data
+
+
+def ingest_sources(sources, max_workers=None):
+    '''
+    Reads many raw sources concurrently in a pool of worker processes.
+
+    @param sources - A list of source dicts (see read_source).
+    @param max_workers - Number of worker processes. Defaults to the number of CPUs.
+
+    @return list of geopandas dataframes, in the same order as sources
+    '''
+    if max_workers == 1:
+        return [read_source(source) for source in sources]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(read_source, sources))
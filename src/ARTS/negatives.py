@@ -0,0 +1,120 @@
+import uuid
+import numpy as np
+import geopandas as gpd
+import shapely
+from datetime import datetime
+from .dataset import ARTSDataset
+from .dataformatting import seed_gen
+from .tiling import tile_boxes
+
+
+def sample_negatives(main_data, regions, n, box_size, basemap_date, region_name, creator_lab, basemap_source,
+                     basemap_resolution, min_distance=0, seed=None, batch_size=10000, max_batches=100):
+    '''
+    Samples negative bounding boxes within regions of interest, away from all known RTS. Candidate boxes are cells of
+    a box_size grid anchored at the origin of EPSG:3413 (so boxes never overlap each other), drawn at random within the
+    regions in batches. A box is rejected if it is not fully within a region, or if it is within min_distance of any
+    positive in the main data set whose BaseMapDate starts in or before the year basemap_date ends in, or whose
+    BaseMapDate cannot be read. This is the same year comparison as in classify_negatives (RTS scars remain visible on
+    later imagery), so no sampled box is flagged as a false negative there. Positives are found with one bulk spatial
+    index query per batch.
+
+    @param main_data - The main ARTS data set, as a geopandas dataframe or an ARTSDataset.
+    @param regions - GeoSeries or GeoDataFrame of regions of interest, in EPSG:3413.
+    @param n - Number of negative boxes to sample.
+    @param box_size - Side length of the boxes, in meters.
+    @param basemap_date - Base map date of the imagery the boxes will be used with, as 'YYYY-MM-DD,YYYY-MM-DD'. A
+                          single 'YYYY-MM-DD' date is used as both the start and the end.
+    @param region_name - RegionName of the new boxes.
+    @param creator_lab - CreatorLab of the new boxes.
+    @param basemap_source - BaseMapSource of the new boxes.
+    @param basemap_resolution - BaseMapResolution of the new boxes.
+    @param min_distance - Minimum distance between a box and any positive, in meters.
+    @param seed - Seed of the random number generator.
+    @param batch_size - Number of candidate boxes drawn per batch.
+    @param max_batches - Maximum number of batches before giving up.
+
+    @return geopandas dataframe with the required ARTS fields and UIDs
+    '''
+    if not isinstance(main_data, ARTSDataset):
+        main_data = ARTSDataset(main_data)
+
+    dates = [item.strip() for item in str(basemap_date).split(',')]
+    if len(dates) == 1:
+        dates = dates * 2
+    try:
+        if len(dates) != 2:
+            raise ValueError
+        for date in dates:
+            datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError('{date} is not a valid base map date (YYYY-MM-DD or YYYY-MM-DD,YYYY-MM-DD).'.format(
+            date=repr(basemap_date)))
+    basemap_date = ','.join(dates)
+
+    # positives with a date that cannot be read could be from any year, so they block boxes too
+    positives = main_data.positions(TrainClass='Positive')
+    positives = positives[np.isnat(main_data.start[positives]) | (
+        main_data.start[positives] <= np.datetime64(dates[1][:4] + '-12-31', 'D'))]
+    positive_tree = shapely.STRtree(np.asarray(main_data.data.geometry.values)[positives])
+
+    regions = gpd.GeoSeries(regions.geometry if isinstance(regions, gpd.GeoDataFrame) else regions)
+    region = shapely.union_all(np.asarray(regions.values))
+    shapely.prepare(region)
+
+    minx, miny, maxx, maxy = region.bounds
+    col_min, col_max = int(np.floor(minx / box_size)), int(np.floor(maxx / box_size))
+    row_min, row_max = int(np.floor(miny / box_size)), int(np.floor(maxy / box_size))
+
+    rng = np.random.default_rng(seed)
+    accepted = set()
+
+    for _ in range(max_batches):
+        cols = rng.integers(col_min, col_max + 1, batch_size)
+        rows = rng.integers(row_min, row_max + 1, batch_size)
+        cells = np.unique(np.stack([cols, rows], axis=1), axis=0)
+        cells = np.array([cell for cell in cells if (cell[0], cell[1]) not in accepted]).reshape(-1, 2)
+
+        boxes = tile_boxes(cells[:, 0], cells[:, 1], box_size)
+        keep = shapely.covered_by(boxes, region)
+
+        near_positive = positive_tree.query(boxes[keep], predicate='dwithin', distance=min_distance) \
+            if min_distance > 0 else positive_tree.query(boxes[keep], predicate='intersects')
+        is_near = np.zeros(keep.sum(), dtype=bool)
+        is_near[near_positive[0]] = True
+        keep[np.flatnonzero(keep)[is_near]] = False
+
+        for col, row in cells[keep][rng.permutation(keep.sum())]:
+            if len(accepted) == n:
+                break
+            accepted.add((col, row))
+
+        if len(accepted) == n:
+            break
+
+    if len(accepted) < n:
+        raise ValueError(
+            'Only {count} of {n} negative boxes could be placed. Are the regions large enough for this box_size and '
+            'min_distance?'.format(count=len(accepted), n=n))
+
+    cells = np.array(sorted(accepted))
+    negatives = gpd.GeoDataFrame(
+        geometry=tile_boxes(cells[:, 0], cells[:, 1], box_size), crs='EPSG:3413'
+    )
+
+    centroids = negatives.centroid.to_crs(4326)
+    negatives['CentroidLat'] = centroids.y.round(5)
+    negatives['CentroidLon'] = centroids.x.round(5)
+    negatives['RegionName'] = region_name
+    negatives['CreatorLab'] = creator_lab
+    negatives['BaseMapDate'] = basemap_date
+    negatives['BaseMapSource'] = basemap_source
+    negatives['BaseMapResolution'] = float(basemap_resolution)
+    negatives['TrainClass'] = 'Negative'
+    negatives['LabelType'] = 'BoundingBox'
+
+    negatives = seed_gen(negatives)
+    negatives['UID'] = [str(uuid.uuid5(uuid.NAMESPACE_DNS, name=item)) for item in negatives.seed]
+    negatives = negatives.drop(['seed', 'BaseMapResolutionStr'], axis=1)
+
+    return negatives[[item for item in negatives.columns if item != 'geometry'] + ['geometry']]
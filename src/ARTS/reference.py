@@ -0,0 +1,585 @@
+'''
+Frozen copies of check_intersections, classify_negatives, merge_data and split_with_buffer (and the helpers they
+use) as they were before any performance work. They are the reference semantics for the equivalence checks in
+equivalence.py. Do not optimize, fix or otherwise change these functions: behaviour changes belong in
+dataformatting.py and autosplit.py, and are only accepted if equivalence.py still reports no differences (or the
+differences are intended, in which case this file is updated in the same change).
+'''
+import math
+import os
+import random
+import re
+import warnings
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from datetime import datetime
+from pathlib import Path
+from tqdm.auto import tqdm
+
+
+def get_earliest_uid(polygon, new_data):
+    '''
+    get_earliest_uid
+    Gets the UID of the first version of an RTS which was contributed to the dataset. If there are multiple versions of the same RTS within the same contribution, the feature with the earliest base map date is used.
+
+    @param polygon - A geodataframe with a single RTS feature.
+    @param new_data - The main ARTS data set.
+
+    @return `UID` from feature with earliest `BaseMapDate` for features in `new_data` that overlap each other.
+    '''
+    uids = [polygon['UID']] + \
+        [x for x in polygon['SelfIntersections'].split(',') if x != '']
+
+    new_data = new_data[new_data.UID.isin(uids)]
+
+    new_data['StartDate'] = pd.to_datetime([re.split(',', item)[0] for item in new_data.BaseMapDate])
+
+    earliest = new_data[new_data.StartDate == new_data.StartDate.min()]
+
+    return earliest.UID.iloc[0]
+
+
+def get_intersecting_uids(polygon, main_data):
+    '''
+    get_intersecting_uuids
+    Gets the UIDs of any RTS polygons which overlap or touch.
+
+    @param polygon - A geodataframe with a single RTS feature.
+    @param main_data - The main ARTS data set.
+
+    @return `UID` of overlapping or touching RTS.
+    '''
+    intersecting_df = polygon.sjoin(main_data, how = 'right', predicate = 'intersects')
+    intersecting_df = intersecting_df[~np.isnan(intersecting_df.index_left)]
+    intersections = [','.join(list(intersecting_df.UID_right))]
+    return intersections
+
+
+def get_touching_uids(polygon, main_data):
+    '''
+    get_touching_uuids
+    Gets the UIDs of any rts polygons which touch (only the edges touch, no overlap)
+
+    @param polygon - A geodataframe with a single RTS feature.
+    @param main_data - The main ARTS data set.
+
+    @return `UID` of touching RTS.
+    '''
+    adjacent_df = polygon.sjoin(main_data, how = 'right', predicate = 'touches')
+    adjacent_df = adjacent_df[~np.isnan(adjacent_df.index_left)]
+    adjacent_polys = [','.join(list(adjacent_df.UID_right))]
+    return adjacent_polys
+
+
+def remove_adjacent_polys(intersections, adjacent_polys):
+    '''
+    remove_adjacent_polys
+    Removes the UIDs from the adjacent_polys column of any polygons which touch, but do not overlap, the current rts polygon.
+
+    @param intersections - The column of the new data which contains UIDs of intersecting RTS.
+    @param adjacent_polys - The column of the new data which contains UIDs of adjacent RTS.
+
+    @return `UID` of overlapping (but not touching) RTS.
+    '''
+    intersections = [item.split(',') for item in intersections]
+    adjacent_polys = [item.split(',') for item in adjacent_polys]
+    fixed_intersections = []
+    for idx in range(0, len(intersections)):
+        fixed_intersection = [
+            [intersection for intersection in intersections[idx] if intersection not in adjacent_polys[idx]]]
+        fixed_intersections = fixed_intersections + fixed_intersection
+    fixed_intersections = [','.join(item) for item in fixed_intersections]
+    return fixed_intersections
+
+
+def classify_negatives(overlapping_data, main_data):
+    '''
+    Automatically classify overlapping UIDs which are negative bounding boxes that overlap other negative bounding boxes.
+
+    @param overlapping_data - The overlapping data set.
+    @param main_data - The main ARTS data set.
+    '''
+
+    negative_classifications = []
+    
+    for intersection, self_intersection, train_class, base_map_date in zip(
+        tqdm(overlapping_data.Intersections), 
+        overlapping_data.SelfIntersections, 
+        overlapping_data.TrainClass, 
+        overlapping_data.BaseMapDate
+    ):
+
+        intersection_split = intersection.split(',')
+        self_intersection_split = self_intersection.split(',')
+        dates = [int(date.split('-')[0]) for date in base_map_date.split(',')]
+
+        if train_class == 'Negative' and (len(intersection) > 0 or len(self_intersection) > 0):
+
+            # repeat negatives
+            uids_negative_main = list(
+                main_data.loc[(main_data.UID.isin(intersection_split)) & (main_data.TrainClass == 'Negative')]
+                .UID
+            )
+            
+            uids_negative_overlapping = list(
+                overlapping_data.loc[
+                (overlapping_data.UID.isin(self_intersection_split)) & (overlapping_data.TrainClass == 'Negative')
+                ]
+                .UID
+            )
+            
+            repeat_negative = ','.join(
+                [item for item in intersection_split if item in uids_negative_main] +
+                [item for item in self_intersection_split if item in uids_negative_overlapping]
+            )
+            
+            # false negatives
+            uids_old_main = list(
+                main_data.loc[
+                (
+                    main_data.UID.isin(intersection_split)
+                ) & (
+                    main_data.TrainClass == 'Positive'
+                ) & (
+                    pd.Series([
+                        [
+                            int(date.split('-')[0]) for date in map_dates.split(',')
+                            ][0] <= dates[1] for map_dates in main_data.BaseMapDate
+                        ])
+                    )
+                ]
+                .UID
+            )
+            uids_old_overlapping = list(
+                overlapping_data.loc[
+                (
+                    overlapping_data.UID.isin(self_intersection_split)
+                ) & (
+                    overlapping_data.TrainClass == 'Positive'
+                ) & (
+                    pd.Series([
+                        [
+                            int(date.split('-')[0]) for date in map_dates.split(',')
+                            ][0] <= dates[1] for map_dates in overlapping_data.BaseMapDate
+                        ])
+                    )
+                ]
+                .UID
+            )
+
+            false_negative = ','.join(
+                [item for item in intersection_split if item in uids_old_main] +
+                [item for item in self_intersection_split if item in uids_old_overlapping]
+            )
+
+            # new rts
+            uids_new_main = main_data.copy(deep = True)
+            uids_new_main['year'] = pd.Series([
+                [
+                    int(date.split('-')[0]) for date in map_dates.split(',')
+                    ][0] > dates[1] for map_dates in main_data.BaseMapDate
+                ])
+            uids_new_main = uids_new_main.sort_values('year').groupby('UID').head(1)
+            uids_new_main = list(
+                uids_new_main.loc[
+                (
+                    uids_new_main.UID.isin(intersection_split)
+                ) & (
+                    uids_new_main.TrainClass == 'Positive'
+                ) & (
+                    uids_new_main.year > dates[1]
+                )
+                ]
+                .UID
+            )
+            
+            uids_new_overlapping = overlapping_data.copy(deep = True)
+            uids_new_overlapping['year'] = pd.Series([
+                [
+                    int(date.split('-')[0]) for date in map_dates.split(',')
+                    ][0] > dates[1] for map_dates in uids_new_overlapping.BaseMapDate
+                ])
+            uids_new_overlapping = uids_new_overlapping.sort_values('year').groupby('UID').head(1)
+            
+            uids_new_overlapping = list(
+                uids_new_overlapping.loc[
+                (
+                    uids_new_overlapping.UID.isin(self_intersection_split)
+                ) & (
+                    uids_new_overlapping.TrainClass == 'Positive'
+                ) & (
+                    uids_new_overlapping.year > dates[1]
+                )
+                ]
+                .UID
+            )
+
+            new_rts = ','.join(
+                [item for item in intersection_split if item in uids_new_main] +
+                [item for item in self_intersection_split if item in uids_new_overlapping]
+            )
+
+        elif train_class == 'Positive' and (len(intersection) > 0 or len(self_intersection) > 0):
+        
+            # repeat negatives
+            repeat_negative = ''
+            
+            # false negatives
+            uids_old_main = list(
+                main_data.loc[
+                (
+                    main_data.UID.isin(intersection_split)
+                ) & (
+                    main_data.TrainClass == 'Negative'
+                ) & (
+                    pd.Series([
+                        [
+                            int(date.split('-')[0]) for date in map_dates.split(',')
+                            ][1] >= dates[0] for map_dates in main_data.BaseMapDate
+                        ])
+                    )
+                ]
+                .UID
+            )
+            uids_old_overlapping = list(
+                overlapping_data.loc[
+                (
+                    overlapping_data.UID.isin(self_intersection_split)
+                ) & (
+                    overlapping_data.TrainClass == 'Negative'
+                ) & (
+                    pd.Series([
+                        [
+                            int(date.split('-')[0]) for date in map_dates.split(',')
+                            ][1] >= dates[0] for map_dates in overlapping_data.BaseMapDate
+                        ])
+                    )
+                ]
+                .UID
+            )
+
+            false_negative = ','.join(
+                [item for item in intersection_split if item in uids_old_main] +
+                [item for item in self_intersection_split if item in uids_old_overlapping]
+            )
+
+            # new rts
+            uids_new_main = list(
+                main_data.loc[
+                (
+                    main_data.UID.isin(intersection_split)
+                ) & (
+                    main_data.TrainClass == 'Negative'
+                ) & (
+                    pd.Series([
+                        [
+                            int(date.split('-')[0]) for date in map_dates.split(',')
+                            ][1] < dates[0] for map_dates in main_data.BaseMapDate
+                        ])
+                    )
+                ]
+                .UID
+            )
+            uids_new_overlapping = list(
+                overlapping_data.loc[
+                (
+                    overlapping_data.UID.isin(self_intersection_split)
+                ) & (
+                    overlapping_data.TrainClass == 'Negative'
+                ) & (
+                    pd.Series([
+                        [
+                            int(date.split('-')[0]) for date in map_dates.split(',')
+                            ][1] < dates[0] for map_dates in overlapping_data.BaseMapDate
+                        ])
+                    )
+                ]
+                .UID
+            )
+
+            new_rts = ','.join(
+                [item for item in intersection_split if item in uids_new_main] +
+                [item for item in self_intersection_split if item in uids_new_overlapping]
+            )
+
+        else:
+            repeat_negative = ''
+            false_negative = ''
+            new_rts = ''
+
+        negative_classifications.append([repeat_negative, false_negative, new_rts])
+
+    negative_classifications = pd.DataFrame(
+        negative_classifications, 
+        columns = ['RepeatNegative', 'FalseNegative', 'NewRTS']
+    )
+
+    return negative_classifications
+
+
+def check_intersections(new_data, main_data, out_path, demo):
+    '''
+    Check intersections between data to be submitted and the main data set.
+
+    @param new_data - The new RTS data set.
+    @param main_data - The main RTS data set.
+    @param out_path - The file path where you would like to save the intersecting polygon data set.
+    @param demo - Boolean. Are you running this script as a demo? 
+
+    @return geopandas dataframe with intersecting features
+    '''
+
+    print('Getting intersections')
+    intersections = []
+    adjacent_polys = []
+    
+    
+    for idx in tqdm(range(0, new_data.shape[0])):
+        new_intersections = get_intersecting_uids(
+            new_data.iloc[[idx]], main_data)
+        intersections = intersections + new_intersections
+
+        new_adjacent_polys = get_touching_uids(new_data.iloc[[idx]], main_data)
+        adjacent_polys = adjacent_polys + new_adjacent_polys
+
+    new_data['Intersections'] = intersections
+    new_data['AdjacentPolys'] = adjacent_polys
+
+    new_data.Intersections = remove_adjacent_polys(
+        new_data.Intersections, new_data.AdjacentPolys
+    )
+    
+    print('Getting self intersections')
+    intersections = []
+    adjacent_polys = []
+
+    for idx in tqdm(range(0, new_data.shape[0])):
+        new_intersections = get_intersecting_uids(
+            new_data.iloc[[idx]], new_data.drop([idx]))
+        intersections = intersections + new_intersections
+
+        new_adjacent_polys = get_touching_uids(
+            new_data.iloc[[idx]], new_data.drop(idx))
+        adjacent_polys = adjacent_polys + new_adjacent_polys
+
+    new_data['SelfIntersections'] = intersections
+    new_data['SelfAdjacentPolys'] = adjacent_polys
+
+    new_data.SelfIntersections = remove_adjacent_polys(
+        new_data.SelfIntersections, new_data.SelfAdjacentPolys
+    )
+
+    new_data = new_data.drop(['AdjacentPolys', 'SelfAdjacentPolys'], axis = 1)
+    
+    overlapping_data = new_data.copy()
+    overlapping_data = overlapping_data[(overlapping_data['Intersections'].str.len(
+    ) > 0) | (overlapping_data['SelfIntersections'].str.len(
+    ) > 0)]
+
+    if overlapping_data.shape[0] > 0:
+        if 'RepeatRTS' not in list(overlapping_data.columns.values):
+            overlapping_data['RepeatRTS'] = ['']*overlapping_data.shape[0]
+        if 'MergedRTS' not in list(overlapping_data.columns.values):
+            overlapping_data['MergedRTS'] = ['']*overlapping_data.shape[0]
+        if 'SplitRTS' not in list(overlapping_data.columns.values):
+            overlapping_data['SplitRTS'] = ['']*overlapping_data.shape[0]
+        if 'StabilizedRTS' not in list(overlapping_data.columns.values):
+            overlapping_data['StabilizedRTS'] = ['']*overlapping_data.shape[0]
+        if 'AccidentalOverlap' not in list(overlapping_data.columns.values):
+            overlapping_data['AccidentalOverlap'] = ['']*overlapping_data.shape[0]
+        if 'UnknownRelationship' not in list(overlapping_data.columns.values):
+            overlapping_data['UnknownRelationship'] = ['']*overlapping_data.shape[0]
+            
+        print('Classifying negative bounding box relationships')
+        negative_classifications = classify_negatives(overlapping_data, main_data)
+        overlapping_data = overlapping_data.set_axis(negative_classifications.index).join(negative_classifications)
+
+        if demo == False:
+
+            if not os.path.exists(out_path):
+                os.makedirs(out_path)
+                
+            overlapping_data.to_file(
+                out_path
+            )
+
+            print(
+                'Overlapping polygons have been saved to ' +
+                str(out_path)
+            )
+
+    else:
+        print('There were no overlapping polygons. Proceed to the next code chunk without any manual editing.')
+
+    return new_data
+
+
+def merge_data(new_data, edited_file):
+    '''
+    merge the data to be submitted with manually edited, intersection-checked file.
+
+    @param new_data - The new data set.
+    @param edited_file - The manually edited file with intersection information.
+
+    @return new data with edited columns appended
+    '''
+    if Path.exists(Path(edited_file)):
+        overlapping_data = (
+            gpd.read_file(edited_file)
+            .drop('geometry', axis = 1)
+        )
+        
+        for column in ['Intersections', 'SelfIntersections', 'RepeatRTS', 'RepeatNegative', 'MergedRTS', 'SplitRTS', 'NewRTS', 'StabilizedRTS', 'AccidentalOverlap', 'FalseNegative', 'UnknownRelationship'] :
+            overlapping_data[column] = overlapping_data[column].astype(str)
+            overlapping_data[column].loc[overlapping_data[column] == 'nan'] = ''
+            overlapping_data = overlapping_data.replace(to_replace = 'None', value = '')
+
+        new_data = pd.merge(new_data,
+                            overlapping_data,
+                            how='outer',
+                            on=[item for item in list(new_data.columns) if item != 'geometry'])
+
+        for column in ['RepeatRTS', 'RepeatNegative', 'MergedRTS', 'SplitRTS', 'NewRTS', 'StabilizedRTS', 'AccidentalOverlap', 'FalseNegative', 'UnknownRelationship'] :
+            new_data[column] = new_data[column].astype(str)
+            new_data[column].loc[new_data[column] == 'nan'] = ''
+        
+        not_repeat = new_data.RepeatRTS == ''
+
+        original_uid_exists = pd.Series(
+            [pd.Series([repeat in intersections for repeat in repeats]).any() 
+             for repeats, intersections 
+             in zip(new_data.RepeatRTS.str.split(','), new_data.Intersections.str.split(','))]
+        )
+
+        original_uid = [
+            [repeat for repeat in repeats if repeat in intersections][0]
+            for repeats, intersections 
+            in zip(
+                new_data.RepeatRTS[original_uid_exists & ~not_repeat].str.split(','),
+                new_data.Intersections[original_uid_exists & ~not_repeat].str.split(',')
+                )
+            ]
+
+        oldest_new_uid = new_data[~original_uid_exists & ~not_repeat].apply(get_earliest_uid, new_data=new_data, axis=1)
+
+        new_data.loc[original_uid_exists & ~not_repeat, 'UID'] = original_uid
+        new_data.loc[~original_uid_exists & ~not_repeat, 'UID'] = oldest_new_uid
+        
+        new_data = new_data.replace(to_replace = 'None', value = '')
+
+        new_data["ContributionDate"] = datetime.today().strftime('%Y-%m-%d')
+
+    else:
+        new_data['RepeatRTS'] = ['']*new_data.shape[0]
+        new_data['RepeatNegative'] = ['']*new_data.shape[0]
+        new_data['MergedRTS'] = ['']*new_data.shape[0]
+        new_data['SplitRTS'] = ['']*new_data.shape[0]
+        new_data['NewRTS'] = ['']*new_data.shape[0]
+        new_data['StabilizedRTS'] = ['']*new_data.shape[0]
+        new_data['AccidentalOverlap'] = ['']*new_data.shape[0]
+        new_data['FalseNegative'] = ['']*new_data.shape[0]
+        new_data['ContributionDate'] = datetime.today().strftime('%Y-%m-%d')
+
+        warnings.warn(
+            "No manually edited file has been imported. This is okay if there were no overlapping polygons, but is a problem otherwise.")
+
+    return new_data
+
+
+def split_with_buffer(df, subset_names, probs, tile_size):
+    """
+     Split a dataframe into subsets. This is useful for leakage-free data splitting for deep learning model training.
+     @param df - The dataframe to be split. It must have the'zone'and'buffer'columns
+     @param subset_names - The names of the training subset
+     @param probs
+     @param tile_size
+    """
+
+    if len(subset_names) != len(probs):
+        raise ValueError(
+            "The length of subset_names must be equal to the length of probs.")
+
+    # buffer polygons with information from tile_size
+    df_buffer = df
+    # may be able to change this to be more conservative, depending on how tiles are centered on polygons
+    df_buffer['buffer'] = df.buffer(math.sqrt(tile_size**2 * 2))
+    df_buffer = df_buffer.set_geometry('buffer')
+    df_buffer['zone'] = 0
+
+    # find groups of polygons that are close together and must be kept in the same training subset
+    grouped_df = df_buffer[['zone', 'buffer']].dissolve(
+        by='zone').explode(ignore_index=True)
+
+    # get the count of polygons in each group
+    grouped_df['count'] = df_buffer.sjoin(
+        grouped_df).groupby(['index_right'])['ID'].count()
+
+    # Arrange by number of polygons within each group; starting with large groups and finishing with small groups makes it more likely that you actually get the desired number of polygons in each group
+    grouped_df = grouped_df.sort_values(
+        by='count', ascending=False, ignore_index=True)
+
+    # prep variables to keep track of how many polygons are in each subset throughout the subset assignment for loop
+    # could be off by 1 row due to rounding
+    target_n = [round(value*df.shape[0]) for value in probs]
+
+    # fix potential rounding error - is there a more concise way to add one to the element of target_n which has the largest decimal place value?
+    if df.shape[0] - sum(target_n) == 1:
+        weighted = [value*df.shape[0] for value in [0.8, 0.1, 0.1]]
+        mod = [value % 1 for value in weighted]
+        idx = [idx for idx, value in enumerate(mod) if value == max(mod)]
+        target_n[idx[0]] = target_n[idx[0]] + 1
+
+    counts = [0]*len(subset_names)
+
+    probs = dict(zip(subset_names, probs))
+    target_n = dict(zip(subset_names, target_n))
+    counts = dict(zip(subset_names, counts))
+
+    # assign subset groups to polygons in for loop
+    subsets = []
+    for idx, row in grouped_df.iterrows():
+
+        # check if any categories have been completed and remove those categories from what can be assigned as a subset group
+        complete_categories = [
+            key for key in target_n if counts[key] == target_n[key]]
+        subset_names = [
+            item for item in subset_names if item not in complete_categories]
+        probs = {key: prob for key, prob in probs.items(
+        ) if key not in complete_categories}
+        probs = {key: prob/sum(probs.values()) for key, prob in probs.items()}
+
+        # randomly choose a subset group
+        subset = random.choices(subset_names, weights=list(probs.values()))[0]
+
+        # check if applying the new subset group to the next row will overshoot the target number for that group
+        if idx < grouped_df.shape[0] and counts[subset] + grouped_df['count'].iloc[idx] > target_n[subset]:
+            skip_subset = [subset]
+
+            subset = random.choices(
+                [key for key in subset_names if key != skip_subset],
+                weights=[prob/sum([prob for key, prob in probs.items() if key != skip_subset])
+                         for key, prob in probs.items() if key != skip_subset]
+
+            )[0]
+
+        if idx < grouped_df.shape[0] and counts[subset] + grouped_df.iloc[idx]['count'] > target_n[subset]:
+            skip_subset = skip_subset + [subset]
+
+            subset = random.choices(
+                [key for key in subset_names if key != skip_subset],
+                weights=[prob/sum([prob for key, prob in probs.items() if key != skip_subset])
+                         for key, prob in probs.items() if key != skip_subset]
+
+            )[0]
+
+        counts[subset] = counts[subset] + grouped_df['count'].iloc[idx]
+
+        subsets = subsets + [subset]
+
+    grouped_df['subset'] = subsets
+    groups_df = df_buffer.sjoin(
+        grouped_df)[['ID', 'Long', 'Lat', 'subset', 'geometry']]
+    groups_df = groups_df.set_geometry('geometry')
+
+    return groups_df
@@ -0,0 +1,145 @@
+import numpy as np
+import geopandas as gpd
+import shapely
+from pathlib import Path
+from .diff import geometry_hashes
+from .schema import decode_uids
+
+
+# fixed extent of the Hilbert curve in EPSG:3413, so keys do not depend on the extent of the data
+HILBERT_EXTENT = (-5000000, -5000000, 5000000, 5000000)
+# bits per axis of the Hilbert curve. 2**20 cells over 10,000 km is ~10 m.
+HILBERT_ORDER = 20
+
+
+def flatgeobuf_path(filepath):
+    '''
+    Gets the file path of the FlatGeobuf copy of a release. It is named after the release, so it has to be kept next
+    to it (and renamed with it).
+
+    @param filepath - The file path of the release (e.g. ARTS_main_dataset_v.3.1.0.geojson).
+
+    @return file path with a .fgb extension
+    '''
+    return Path(filepath).with_suffix('.fgb')
+
+
+def hilbert_keys(geometry, extent=HILBERT_EXTENT, order=HILBERT_ORDER):
+    '''
+    Computes the position of the centroid of each geometry along a Hilbert curve over a fixed extent. Geometries
+    which are close to each other mostly get close keys.
+
+    @param geometry - A GeoSeries or array of geometries in EPSG:3413.
+    @param extent - (minx, miny, maxx, maxy) of the curve. Centroids outside of it are clipped to its edge.
+    @param order - Number of bits per axis.
+
+    @return numpy array of uint64 keys
+    '''
+    centroids = shapely.centroid(np.asarray(gpd.GeoSeries(geometry).values))
+    minx, miny, maxx, maxy = extent
+    n = 1 << order
+
+    def to_cells(values, low, high):
+        cells = np.floor((np.nan_to_num(values, nan=low) - low) / (high - low) * n)
+        return np.clip(cells, 0, n - 1).astype(np.uint64)
+
+    x = to_cells(shapely.get_x(centroids), minx, maxx)
+    y = to_cells(shapely.get_y(centroids), miny, maxy)
+    keys = np.zeros(len(x), dtype=np.uint64)
+
+    s = n >> 1
+    while s > 0:
+        rx = (x & np.uint64(s)) > 0
+        ry = (y & np.uint64(s)) > 0
+        keys += np.uint64(s) * np.uint64(s) * ((3 * rx.astype(np.uint64)) ^ ry.astype(np.uint64))
+
+        # rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, np.uint64(n - 1) - x, x)
+        y = np.where(flip, np.uint64(n - 1) - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+
+        s = s >> 1
+
+    return keys
+
+
+def hilbert_sort(data):
+    '''
+    Sorts a data set along a Hilbert curve over the centroids of its features, with the UID, the BaseMapDate and a
+    hash of the geometry WKB as tiebreaks, so releases are spatially clustered (cheaper bounding box reads, chunked
+    processing and better compression) and their row order mostly does not depend on the order of contributions.
+    Features which tie on all of these keep their relative order, so the row order is only independent of the order
+    of contributions if no two features share a key, UID, BaseMapDate and geometry.
+
+    @param data - The ARTS data set, in EPSG:3413.
+
+    @return geopandas dataframe with a new index
+    '''
+    keys = hilbert_keys(data.geometry)
+    uids = np.array(decode_uids(data.UID.reset_index(drop=True)), dtype=object) if 'UID' in data.columns \
+        else np.zeros(len(keys), dtype=object)
+
+    dates = data.BaseMapDate.astype(str).values if 'BaseMapDate' in data.columns \
+        else np.zeros(len(keys), dtype=object)
+
+    # np.lexsort sorts by the last key first
+    order = np.lexsort((geometry_hashes(data.geometry), dates.astype(str), uids.astype(str), keys))
+
+    return data.iloc[order].reset_index(drop=True)
+
+
+def check_geometries(data):
+    '''
+    Checks that every feature of a release has a geometry. FlatGeobuf files with a spatial index cannot hold features
+    without one.
+
+    @param data - The ARTS data set.
+    '''
+    missing = data.geometry.isna().values
+    if missing.any():
+        uids = decode_uids(data.UID[missing]) if 'UID' in data.columns else []
+        raise ValueError(
+            '{count} features have no geometry (UIDs: {uids}). Fix or remove them before writing the release.'.format(
+                count=missing.sum(), uids=', '.join(str(uid) for uid in uids[:10]) + (', ...' if len(uids) > 10 else '')))
+
+
+def write_flatgeobuf(data, filepath):
+    '''
+    Saves a release as FlatGeobuf with its packed Hilbert R-tree spatial index, so that features within a bounding
+    box can be read without parsing the whole file.
+
+    @param data - The ARTS data set, in the published schema. Every feature must have a geometry.
+    @param filepath - The file path of the release. The extension is replaced with .fgb.
+
+    @return file path of the FlatGeobuf file
+    '''
+    check_geometries(data)
+    filepath = flatgeobuf_path(filepath)
+
+    data.to_file(filepath, driver='FlatGeobuf', SPATIAL_INDEX='YES')
+
+    return filepath
+
+
+def read_release(filepath, bbox=None, region=None, columns=None):
+    '''
+    Reads a release, or only the part of it within a bounding box or region. If a FlatGeobuf copy of the release
+    exists, it is used and only the index nodes and features that intersect the bounding box are read from disk.
+
+    @param filepath - The file path of the release (.geojson or .fgb).
+    @param bbox - Optional (minx, miny, maxx, maxy) tuple in the CRS of the release (EPSG:3413).
+    @param region - Optional polygon, GeoSeries or GeoDataFrame. Only features which intersect it are returned.
+                    GeoSeries and GeoDataFrames are reprojected to the CRS of the release if necessary.
+    @param columns - Optional list of metadata columns to read.
+
+    @return geopandas dataframe
+    '''
+    if bbox is not None and region is not None:
+        raise ValueError('Provide either bbox or region, not both.')
+
+    filepath = Path(filepath)
+    if flatgeobuf_path(filepath).exists():
+        filepath = flatgeobuf_path(filepath)
+
+    return gpd.read_file(filepath, bbox=bbox, mask=region, columns=columns)
@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pyarrow as pa
+
+
+# low-cardinality metadata fields which are stored as categoricals in memory
+CATEGORICAL_FIELDS = ['RegionName', 'CreatorLab', 'BaseMapSource', 'TrainClass', 'LabelType']
+
+# metadata fields which are stored as dates in memory and as 'YYYY-MM-DD' strings on disk
+DATE_FIELDS = ['ContributionDate']
+
+UID_DTYPE = pd.ArrowDtype(pa.binary(16))
+
+
+def is_binary_uid(uid):
+    '''
+    Checks whether a UID column is stored as 16-byte binary UIDs.
+
+    @param uid - The column which contains UIDs.
+
+    @return Boolean
+    '''
+    return isinstance(uid, pd.Series) and uid.dtype == UID_DTYPE
+
+
+def encode_uids(uids, errors='raise'):
+    '''
+    Converts 36-character UID strings to 16-byte binary UIDs. Missing or empty UIDs are kept as missing values.
+
+    @param uids - An iterable of UID strings.
+    @param errors - 'raise' to raise an error for malformed UIDs, or 'coerce' to set them to missing.
+
+    @return pandas Series of 16-byte binary UIDs
+    '''
+    if isinstance(uids, pd.Series) and uids.dtype == UID_DTYPE:
+        return uids
+
+    encoded = []
+    for uid in uids:
+        if uid is None or pd.isna(uid) or uid == '':
+            encoded.append(None)
+            continue
+
+        if isinstance(uid, bytes):
+            value = uid
+        else:
+            try:
+                value = bytes.fromhex(str(uid).replace('-', ''))
+            except ValueError:
+                value = b''
+
+        if len(value) != 16:
+            if errors == 'raise':
+                raise ValueError(
+                    '{uid} is not a valid UID (UUID5 has not been used).'.format(uid=repr(uid)))
+            value = None
+
+        encoded.append(value)
+
+    index = uids.index if isinstance(uids, pd.Series) else None
+
+    return pd.Series(pd.array(encoded, dtype=UID_DTYPE), index=index, name='UID')
+
+
+def decode_uids(uids):
+    '''
+    Converts 16-byte binary UIDs back to 36-character UID strings. String UIDs are returned unchanged.
+
+    @param uids - The column which contains UIDs.
+
+    @return list of UID strings
+    '''
+    if not is_binary_uid(uids):
+        return list(uids)
+
+    decoded = []
+    for value in uids.array:
+        if value is None or value is pd.NA:
+            decoded.append('')
+            continue
+
+        value = value.hex()
+        decoded.append('-'.join([value[0:8], value[8:12], value[12:16], value[16:20], value[20:32]]))
+
+    return decoded
+
+
+def uid_keys(uids):
+    '''
+    Gets the UIDs as a numpy array of 16-byte keys, which can be sorted and searched.
+
+    @param uids - The column which contains UIDs (binary or string) or a list of UID strings.
+
+    @return numpy array with dtype 'S16'
+    '''
+    uids = encode_uids(uids, errors='coerce')
+    array = pa.array(uids.array).fill_null(b'\x00' * 16)
+
+    return np.frombuffer(
+        array.buffers()[1], dtype='S16', count=len(array), offset=array.offset * 16
+    ).copy()
+
+
+def uid_mask(uid, values):
+    '''
+    Equivalent of `uid.isin(values)` which works whether the UID column is binary or string.
+
+    @param uid - The column which contains UIDs.
+    @param values - A list of UID strings to look for.
+
+    @return boolean Series
+    '''
+    if is_binary_uid(uid):
+        values = encode_uids(values, errors='coerce').dropna()
+
+    return uid.isin(values)
+
+
+class UIDIndex:
+    '''
+    Sorted index over the UID column of a data set. Lookups are done by binary search on the 16-byte keys, so
+    finding the rows of a set of UIDs does not scan the UID column.
+    '''
+
+    def __init__(self, uid):
+        '''
+        @param uid - The column which contains UIDs (binary or string).
+        '''
+        keys = uid_keys(uid)
+        self.order = np.argsort(keys, kind='stable')
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, uids):
+        '''
+        Gets the row positions of all rows with any of the given UIDs. Several rows can share a UID
+        (e.g. repeat RTS), so one UID can return more than one position.
+
+        @param uids - A list of UIDs (binary or string).
+
+        @return numpy array of row positions, in the order the UIDs were given
+        '''
+        query = uid_keys(pd.Series(list(uids), dtype=object) if not isinstance(uids, pd.Series) else uids)
+        query = query[query != b'']
+
+        left = np.searchsorted(self.keys, query, side='left')
+        right = np.searchsorted(self.keys, query, side='right')
+        n_matches = right - left
+
+        offset = np.arange(n_matches.sum()) - np.repeat(np.cumsum(n_matches) - n_matches, n_matches)
+
+        return self.order[np.repeat(left, n_matches) + offset]
+
+    def isin(self, uids):
+        '''
+        Equivalent of `uid.isin(uids)` using the index.
+
+        @param uids - A list of UIDs (binary or string).
+
+        @return boolean numpy array
+        '''
+        mask = np.zeros(len(self.keys), dtype=bool)
+        mask[self.positions(uids)] = True
+
+        return mask
+
+
+def compact(df):
+    '''
+    Converts a data set to the in-memory ARTS schema: categorical low-cardinality fields, 16-byte binary UIDs and
+    native dates. Columns which are not present are skipped.
+
+    @param df - A data set in the published ARTS schema.
+
+    @return data set in the in-memory ARTS schema
+    '''
+    df = df.copy()
+
+    for field in [item for item in CATEGORICAL_FIELDS if item in df.columns]:
+        df[field] = df[field].astype('category')
+
+    for field in [item for item in DATE_FIELDS if item in df.columns]:
+        df[field] = pd.to_datetime(df[field], format='%Y-%m-%d')
+
+    if 'UID' in df.columns:
+        df['UID'] = encode_uids(df.UID).set_axis(df.index)
+
+    return df
+
+
+def publishable(df):
+    '''
+    Converts a data set back to the published ARTS schema: string metadata fields, 36-character UIDs and
+    'YYYY-MM-DD' dates. This should only be needed right before writing to file.
+
+    @param df - A data set in either schema.
+
+    @return data set in the published ARTS schema
+    '''
+    df = df.copy()
+
+    for field in [item for item in CATEGORICAL_FIELDS if item in df.columns]:
+        if isinstance(df[field].dtype, pd.CategoricalDtype):
+            df[field] = df[field].astype(object)
+
+    for field in [item for item in DATE_FIELDS if item in df.columns]:
+        if pd.api.types.is_datetime64_any_dtype(df[field]):
+            df[field] = df[field].dt.strftime('%Y-%m-%d')
+
+    if 'UID' in df.columns and is_binary_uid(df.UID):
+        df['UID'] = decode_uids(df.UID)
+
+    return df
+
+
+def read_main_dataset(filepath, fields=None):
+    '''
+    Reads the main ARTS data set into the in-memory ARTS schema.
+
+    @param filepath - The file path of the main ARTS data set.
+    @param fields - Optional list of metadata columns to keep.
+
+    @return geopandas dataframe in the in-memory ARTS schema
+    '''
+    main_data = gpd.read_file(filepath)
+
+    if fields is not None:
+        main_data = main_data.filter(items=fields + ['geometry'])
+
+    return compact(main_data)
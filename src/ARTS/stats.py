@@ -0,0 +1,264 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from .dataset import basemap_date_range
+
+
+# fields with counts per value in the catalog
+COUNT_FIELDS = ['CreatorLab', 'RegionName', 'TrainClass']
+
+# relative accuracy of the area quantiles
+RELATIVE_ACCURACY = 0.01
+
+
+def stats_path(filepath):
+    '''
+    Gets the file path of the statistics catalog of a release. The catalog is named after the release, so it has to be
+    kept next to it (and renamed with it) for the next release to be updated incrementally.
+
+    @param filepath - The file path of the release (e.g. ARTS_main_dataset.geojson).
+
+    @return file path ending with _stats.json
+    '''
+    filepath = Path(filepath)
+
+    return filepath.with_name(filepath.stem + '_stats.json')
+
+
+def _gamma(relative_accuracy):
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def area_sketch(area, relative_accuracy=RELATIVE_ACCURACY):
+    '''
+    Summarizes areas as counts in logarithmic bins. Any quantile read from the bins is within relative_accuracy of
+    the exact quantile, and the bins of two sketches can be merged by adding their counts.
+
+    @param area - Array of areas.
+    @param relative_accuracy - Relative accuracy of the quantiles.
+
+    @return dict with the relative accuracy, the number of zero areas and the count of each bin
+    '''
+    area = np.asarray(area, dtype=float)
+    area = area[~np.isnan(area)]
+    positive = area[area > 0]
+
+    bins = np.ceil(np.log(positive) / np.log(_gamma(relative_accuracy))).astype(np.int64)
+    values, counts = np.unique(bins, return_counts=True)
+
+    return {
+        'relative_accuracy': relative_accuracy,
+        'zero': int((area <= 0).sum()),
+        'bins': {str(value): int(count) for value, count in zip(values, counts)}
+    }
+
+
+def sketch_quantile(sketch, q):
+    '''
+    Reads a quantile from an area sketch.
+
+    @param sketch - The area sketch.
+    @param q - The quantile, between 0 and 1.
+
+    @return approximate quantile, or None if the sketch is empty
+    '''
+    bins = sorted((int(value), count) for value, count in sketch['bins'].items())
+    total = sketch['zero'] + sum(count for _, count in bins)
+    if total == 0:
+        return None
+
+    rank = q * (total - 1)
+    if rank < sketch['zero']:
+        return 0.0
+
+    gamma = _gamma(sketch['relative_accuracy'])
+    seen = sketch['zero']
+    for value, count in bins:
+        seen = seen + count
+        if seen > rank:
+            return 2 * gamma ** value / (gamma + 1)
+
+    return 2 * gamma ** bins[-1][0] / (gamma + 1)
+
+
+def _add_counts(a, b):
+    merged = dict(a)
+    for key, count in b.items():
+        merged[key] = merged.get(key, 0) + count
+    return merged
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _date_range(start, end):
+    '''
+    Gets the first and last date of arrays of dates as 'YYYY-MM-DD' strings. Missing dates are skipped.
+    '''
+    start = start[~np.isnat(start)]
+    end = end[~np.isnat(end)]
+
+    return (str(start.min()) if len(start) > 0 else None), (str(end.max()) if len(end) > 0 else None)
+
+
+def summarize(data):
+    '''
+    Builds the statistics catalog of a data set: counts per CreatorLab, RegionName and TrainClass, area sums,
+    extremes and quantile sketches per TrainClass, and base map and contribution date coverage. All of these can be
+    merged with merge_stats.
+
+    @param data - The ARTS data set, in EPSG:3413.
+
+    @return dict
+    '''
+    stats = {'count': int(data.shape[0]), 'counts': {}, 'area': {}}
+
+    for field in COUNT_FIELDS:
+        if field in data.columns:
+            counts = data[field].astype(str).value_counts()
+            stats['counts'][field] = {str(key): int(count) for key, count in counts.items()}
+
+    area = data.geometry.area.values
+    train_class = data['TrainClass'].astype(str).values if 'TrainClass' in data.columns \
+        else np.full(data.shape[0], 'All')
+    for value in np.unique(train_class):
+        class_area = area[train_class == value]
+        stats['area'][str(value)] = {
+            'sum': float(np.nansum(class_area)),
+            'min': float(np.nanmin(class_area)) if len(class_area) > 0 else None,
+            'max': float(np.nanmax(class_area)) if len(class_area) > 0 else None,
+            'sketch': area_sketch(class_area)
+        }
+
+    start, end = basemap_date_range(data.BaseMapDate) if 'BaseMapDate' in data.columns \
+        else (np.array([], dtype='datetime64[D]'), np.array([], dtype='datetime64[D]'))
+    years = pd.Series(start[~np.isnat(start)].astype('datetime64[Y]').astype(str)).value_counts()
+    first, last = _date_range(start, end)
+    stats['basemap_dates'] = {
+        'start': first,
+        'end': last,
+        'years': {str(key): int(count) for key, count in years.items()}
+    }
+
+    if 'ContributionDate' in data.columns:
+        contribution = pd.to_datetime(data.ContributionDate, errors='coerce').values.astype('datetime64[D]')
+    else:
+        contribution = np.array([], dtype='datetime64[D]')
+    first, last = _date_range(contribution, contribution)
+    stats['contribution_dates'] = {'start': first, 'end': last}
+
+    return stats
+
+
+def merge_stats(a, b):
+    '''
+    Merges the statistics catalogs of two disjoint data sets, e.g. a release and a new contribution.
+
+    @param a - A statistics catalog.
+    @param b - Another statistics catalog.
+
+    @return dict
+    '''
+    merged = {'count': a['count'] + b['count'], 'counts': {}, 'area': {}}
+
+    for field in set(a['counts']) | set(b['counts']):
+        merged['counts'][field] = _add_counts(a['counts'].get(field, {}), b['counts'].get(field, {}))
+
+    for value in set(a['area']) | set(b['area']):
+        area_a = a['area'].get(value)
+        area_b = b['area'].get(value)
+        if area_a is None or area_b is None:
+            merged['area'][value] = area_a or area_b
+            continue
+
+        if area_a['sketch']['relative_accuracy'] != area_b['sketch']['relative_accuracy']:
+            raise ValueError('Area sketches with different relative accuracies cannot be merged.')
+
+        merged['area'][value] = {
+            'sum': area_a['sum'] + area_b['sum'],
+            'min': _min(area_a['min'], area_b['min']),
+            'max': _max(area_a['max'], area_b['max']),
+            'sketch': {
+                'relative_accuracy': area_a['sketch']['relative_accuracy'],
+                'zero': area_a['sketch']['zero'] + area_b['sketch']['zero'],
+                'bins': _add_counts(area_a['sketch']['bins'], area_b['sketch']['bins'])
+            }
+        }
+
+    merged['basemap_dates'] = {
+        'start': _min(a['basemap_dates']['start'], b['basemap_dates']['start']),
+        'end': _max(a['basemap_dates']['end'], b['basemap_dates']['end']),
+        'years': _add_counts(a['basemap_dates']['years'], b['basemap_dates']['years'])
+    }
+    merged['contribution_dates'] = {
+        'start': _min(a['contribution_dates']['start'], b['contribution_dates']['start']),
+        'end': _max(a['contribution_dates']['end'], b['contribution_dates']['end'])
+    }
+
+    return merged
+
+
+def read_stats(filepath):
+    '''
+    Reads the statistics catalog of a release.
+
+    @param filepath - The file path of the release or of its catalog.
+
+    @return dict, or None if the release has no catalog
+    '''
+    filepath = Path(filepath)
+    if not filepath.name.endswith('_stats.json'):
+        filepath = stats_path(filepath)
+
+    if not filepath.exists():
+        return None
+
+    with open(filepath) as file:
+        return json.load(file)
+
+
+def write_stats(stats, filepath):
+    '''
+    Saves the statistics catalog of a release.
+
+    @param stats - The statistics catalog.
+    @param filepath - The file path of the release.
+
+    @return file path of the catalog
+    '''
+    filepath = stats_path(filepath)
+
+    temporary_filepath = filepath.with_suffix('.tmp')
+    with open(temporary_filepath, 'w') as file:
+        json.dump(stats, file, indent=2, sort_keys=True)
+    os.replace(temporary_filepath, filepath)
+
+    return filepath
+
+
+def stats_table(stats, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+    '''
+    Formats the area statistics of a catalog as a table, e.g. for release notes.
+
+    @param stats - The statistics catalog.
+    @param quantiles - The area quantiles to include.
+
+    @return pandas DataFrame with one row per TrainClass
+    '''
+    rows = []
+    for value, area in sorted(stats['area'].items()):
+        count = area['sketch']['zero'] + sum(area['sketch']['bins'].values())
+        row = {'TrainClass': value, 'Count': count, 'TotalArea': area['sum'], 'MinArea': area['min'],
+               'MaxArea': area['max']}
+        for q in quantiles:
+            row['Area_q' + str(q)] = sketch_quantile(area['sketch'], q)
+        rows.append(row)
+
+    return pd.DataFrame(rows)
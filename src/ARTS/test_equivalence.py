@@ -0,0 +1,9 @@
+import pytest
+from .equivalence import run_case
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_engines_match_reference(seed):
+    results = run_case(seed, n_sites=60)
+
+    assert results.equivalent.all(), results[~results.equivalent][['engine', 'differences']].to_dict('records')
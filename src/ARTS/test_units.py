@@ -0,0 +1,166 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+import shapely
+from .dedup import find_duplicates
+from .diff import diff_releases
+from .equivalence import synthetic_data
+from .release import hilbert_keys
+from .schema import UIDIndex, decode_uids, encode_uids
+from .stats import RELATIVE_ACCURACY, area_sketch, merge_stats, sketch_quantile, summarize
+from .vectortiles import EXTENT, _zoom_geometries, encode_tile, tile_bounds
+
+
+def _hilbert_index(x, y, n):
+    # textbook conversion of a cell to its distance along a Hilbert curve over an n x n grid
+    d = 0
+    s = n // 2
+    while s > 0:
+        rx = int((x & s) > 0)
+        ry = int((y & s) > 0)
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = n - 1 - x, n - 1 - y
+            x, y = y, x
+        s //= 2
+    return d
+
+
+def test_uid_index():
+    uids = ['a9c1f2e4-0b7d-5e3a-9f21-3c4d5e6f7a8b', '0f1e2d3c-4b5a-5968-8776-655443322110',
+            'a9c1f2e4-0b7d-5e3a-9f21-3c4d5e6f7a8b', '']
+    index = UIDIndex(encode_uids(uids))
+
+    assert sorted(index.positions([uids[0]])) == [0, 2]
+    assert list(index.positions([uids[1], 'ffffffff-ffff-5fff-bfff-ffffffffffff'])) == [1]
+    assert list(index.isin([uids[1]])) == [False, True, False, False]
+    assert decode_uids(encode_uids(uids)) == uids
+
+
+def test_hilbert_keys():
+    n = 16
+    rng = np.random.default_rng(0)
+    cells = rng.integers(0, n, (200, 2))
+    points = gpd.GeoSeries(shapely.points(cells[:, 0] + 0.5, cells[:, 1] + 0.5))
+
+    keys = hilbert_keys(points, extent=(0, 0, n, n), order=4)
+
+    assert list(keys) == [_hilbert_index(int(x), int(y), n) for x, y in cells]
+
+
+def test_sketch_quantile():
+    area = np.random.default_rng(0).lognormal(7, 2, 5000)
+    sketch = area_sketch(area)
+
+    for q in [0, 0.05, 0.5, 0.95, 1]:
+        exact = np.quantile(area, q, method='lower')
+        assert abs(sketch_quantile(sketch, q) - exact) <= RELATIVE_ACCURACY * exact * (1 + 1e-9)
+
+    assert sketch_quantile(area_sketch([]), 0.5) is None
+
+
+def test_merge_stats():
+    main_data, new_data = synthetic_data(0, n_sites=30)
+    new_data['ContributionDate'] = '2024-01-15'
+    both = pd.concat([main_data, new_data], ignore_index=True)
+
+    merged = merge_stats(summarize(main_data), summarize(new_data))
+    expected = summarize(both)
+
+    assert merged['count'] == expected['count']
+    assert merged['counts'] == expected['counts']
+    assert merged['basemap_dates'] == expected['basemap_dates']
+    assert merged['contribution_dates'] == expected['contribution_dates']
+    for value, area in expected['area'].items():
+        assert merged['area'][value]['sketch'] == area['sketch']
+        assert np.isclose(merged['area'][value]['sum'], area['sum'])
+        assert merged['area'][value]['min'] == area['min']
+        assert merged['area'][value]['max'] == area['max']
+
+
+def test_find_duplicates():
+    main_data, _ = synthetic_data(0, n_sites=30)
+    main_data = main_data.drop_duplicates('UID').reset_index(drop=True)
+
+    exact = main_data.iloc[[0]]
+    near = main_data.iloc[[1]].assign(
+        geometry=main_data.iloc[[1]].translate(0.5, 0), UID='11111111-2222-5333-8444-555555555555')
+    other_date = main_data.iloc[[2]].assign(BaseMapDate='2010-07-01,2010-07-31')
+    same_uid = main_data.iloc[[3]].assign(geometry=main_data.iloc[[3]].translate(5000, 0))
+    data = pd.concat([main_data, exact, near, other_date, same_uid], ignore_index=True)
+    n = main_data.shape[0]
+
+    duplicates = find_duplicates(data)
+    pairs = set(zip(duplicates.row_a, duplicates.row_b, duplicates.kind))
+
+    assert (0, n, 'exact') in pairs
+    assert (1, n + 1, 'near') in pairs
+    assert (3, n + 3, 'uid') in pairs
+    assert not any(2 in (a, b) and n + 2 in (a, b) for a, b, _ in pairs)
+
+
+def test_diff_releases():
+    old_data, _ = synthetic_data(1, n_sites=20)
+    new_data = old_data.drop(index=[0]).copy()
+    new_data.loc[5, 'RegionName'] = 'Changed'
+    added = old_data.iloc[[6]].assign(UID='11111111-2222-5333-8444-555555555555')
+    new_data = pd.concat([new_data, added], ignore_index=True)
+
+    diff = diff_releases(old_data, new_data)
+
+    assert list(diff['removed'].UID) == [old_data.UID[0]]
+    assert list(diff['added'].UID) == ['11111111-2222-5333-8444-555555555555']
+    assert diff['modified'][['UID', 'column', 'old', 'new']].values.tolist() == [
+        [old_data.UID[5], 'RegionName', old_data.RegionName[5], 'Changed']]
+
+
+def test_encode_tile_round_trip():
+    mapbox_vector_tile = pytest.importorskip('mapbox_vector_tile')
+
+    bounds = tile_bounds(14, 8000, 5000)
+    minx, miny, maxx, maxy = bounds
+    size = maxx - minx
+
+    def point(x, y):
+        # tile coordinates (y down) to web mercator
+        return minx + x / EXTENT * size, maxy - y / EXTENT * size
+
+    shell = [point(*item) for item in [(100, 100), (2000, 100), (2000, 2000), (100, 2000)]]
+    hole = [point(*item) for item in [(500, 500), (1000, 500), (1000, 1000), (500, 1000)]]
+    features = [
+        (1, shapely.Polygon(shell, [hole]), {'TrainClass': 'Positive', 'Area': 12.5}),
+        (2, shapely.MultiLineString([[point(3000, 3000), point(3500, 3000)], [point(3000, 3500), point(3500, 3600)]]),
+         {'TrainClass': 'Negative'}),
+        (3, shapely.Point(point(4000, 10)), {'Count': 3})
+    ]
+
+    tile = mapbox_vector_tile.decode(encode_tile('ARTS', features, bounds), default_options={'y_coord_down': True})
+    decoded = {feature['id']: feature for feature in tile['ARTS']['features']}
+
+    assert tile['ARTS']['extent'] == EXTENT
+    assert decoded[1]['properties'] == {'TrainClass': 'Positive', 'Area': 12.5}
+    assert decoded[2]['properties'] == {'TrainClass': 'Negative'}
+    assert decoded[3]['properties'] == {'Count': 3}
+
+    polygon = shapely.geometry.shape(decoded[1]['geometry'])
+    assert polygon.geom_type == 'Polygon' and len(polygon.interiors) == 1
+    assert polygon.area == 1900 * 1900 - 500 * 500
+    assert shapely.geometry.shape(decoded[2]['geometry']).equals(
+        shapely.MultiLineString([[(3000, 3000), (3500, 3000)], [(3000, 3500), (3500, 3600)]]))
+    assert shapely.geometry.shape(decoded[3]['geometry']).equals(shapely.Point(4000, 10))
+
+
+def test_zoom_geometries_only_replaces_polygons():
+    geometry = np.array([
+        shapely.MultiLineString([[(1000, 1000), (1001, 1000)], [(1000, 1001), (1001, 1001)]]),
+        shapely.box(0, 0, 0.1, 0.1),
+        shapely.box(0, 0, 1000, 1000)
+    ])
+
+    zoomed = _zoom_geometries(geometry, 14, 1)
+
+    assert zoomed[0].geom_type == 'MultiLineString'
+    assert zoomed[1].geom_type == 'Point'
+    assert zoomed[2].geom_type == 'Polygon'
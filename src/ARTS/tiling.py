@@ -0,0 +1,391 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+
+# values of the label masks
+BACKGROUND = 0
+RTS = 1
+IGNORE = 255
+
+
+def tile_ids(cols, rows):
+    """
+     Builds tile IDs from grid column and row indices.
+
+     @param cols - Array of grid column indices.
+     @param rows - Array of grid row indices.
+
+     @return list of tile IDs in the form 'col_row'
+    """
+    return [str(col) + '_' + str(row) for col, row in zip(cols, rows)]
+
+
+def covering_tiles(bounds, tile_size):
+    """
+     Gets the grid cells of size tile_size that cover a set of bounding boxes. The grid is anchored at the origin of the
+     CRS, so tile IDs are stable between runs and between data set versions.
+
+     @param bounds - Array of shape (n, 4) with minx, miny, maxx, maxy for each feature.
+     @param tile_size - Side length of the tiles, in CRS units.
+
+     @return (cols, rows) arrays of the unique tiles that cover the bounding boxes
+    """
+    bounds = np.asarray(bounds, dtype=float).reshape(-1, 4)
+    if bounds.shape[0] == 0:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    col_min = np.floor(bounds[:, 0] / tile_size).astype(np.int64)
+    row_min = np.floor(bounds[:, 1] / tile_size).astype(np.int64)
+    col_max = np.floor(bounds[:, 2] / tile_size).astype(np.int64)
+    row_max = np.floor(bounds[:, 3] / tile_size).astype(np.int64)
+
+    n_cols = col_max - col_min + 1
+    n_rows = row_max - row_min + 1
+    n_tiles = n_cols * n_rows
+
+    # expand every bounding box into the cells it spans without a python loop
+    feature = np.repeat(np.arange(bounds.shape[0]), n_tiles)
+    offset = np.arange(n_tiles.sum()) - np.repeat(np.cumsum(n_tiles) - n_tiles, n_tiles)
+    cols = col_min[feature] + offset % n_cols[feature]
+    rows = row_min[feature] + offset // n_cols[feature]
+
+    tiles = np.unique(np.stack([cols, rows], axis=1), axis=0)
+
+    return tiles[:, 0], tiles[:, 1]
+
+
+def tile_boxes(cols, rows, tile_size):
+    """
+     Builds the polygons of grid tiles.
+
+     @param cols - Array of grid column indices.
+     @param rows - Array of grid row indices.
+     @param tile_size - Side length of the tiles, in CRS units.
+
+     @return array of shapely polygons
+    """
+    return shapely.box(
+        cols * tile_size, rows * tile_size, (cols + 1) * tile_size, (rows + 1) * tile_size
+    )
+
+
+def _label_tiles(split_results, tile_size):
+    """
+     Walks the tiles of the grid which intersect at least one feature of the split results, subset by subset.
+
+     @return generator of (subset, tile_id, tile box, row positions of the intersecting features in split_results)
+    """
+    _check_subsets_disjoint(split_results, tile_size)
+
+    positions = np.arange(split_results.shape[0])
+
+    for subset in sorted(split_results['subset'].unique()):
+        in_subset = positions[(split_results['subset'] == subset).values]
+        geometries = split_results.geometry.values[in_subset]
+
+        cols, rows = covering_tiles(geometries.bounds, tile_size)
+        boxes = tile_boxes(cols, rows, tile_size)
+
+        # bulk query all tiles of the subset at once, then walk the pairs tile by tile
+        tile_idx, label_idx = shapely.STRtree(np.asarray(geometries)).query(boxes, predicate='intersects')
+        if len(tile_idx) == 0:
+            continue
+
+        order = np.lexsort((label_idx, tile_idx))
+        tile_idx = tile_idx[order]
+        label_idx = label_idx[order]
+        starts = np.flatnonzero(np.r_[True, tile_idx[1:] != tile_idx[:-1]])
+        ends = np.r_[starts[1:], len(tile_idx)]
+
+        for start, end in zip(starts, ends):
+            idx = tile_idx[start]
+            yield subset, str(cols[idx]) + '_' + str(rows[idx]), boxes[idx], in_subset[label_idx[start:end]]
+
+
+def chip_manifest(split_results, tile_size, uid_column='ID'):
+    """
+     Streams the manifest of training chips that contain labels. Each tile of the grid which intersects at least one
+     polygon of the split results is returned once, together with its subset and the identifiers of all intersecting
+     labels, so data loaders can read the labels for a chip without running a spatial query.
+
+     @param split_results - Output of autosplit.split_with_buffer. It must have the 'subset' column and uid_column.
+     @param tile_size - Side length of the training tiles, in CRS units. Use the same value as for split_with_buffer.
+     @param uid_column - Name of the column which identifies the labels. split_with_buffer only returns 'ID' (the
+                         default); merge in 'UID' from the split dataframe to list UIDs instead.
+
+     @return generator of dicts with tile_id, minx, miny, maxx, maxy, subset and uids (values of uid_column)
+    """
+    uids = split_results[uid_column].astype(str).values
+
+    for subset, tile_id, box, positions in _label_tiles(split_results, tile_size):
+        minx, miny, maxx, maxy = box.bounds
+
+        yield {
+            'tile_id': tile_id,
+            'minx': minx,
+            'miny': miny,
+            'maxx': maxx,
+            'maxy': maxy,
+            'subset': subset,
+            'uids': list(uids[positions])
+        }
+
+
+def negative_chips(split_results, tile_size):
+    """
+     Streams the manifest of training chips that do not contain labels. Candidate tiles are taken from the buffered
+     zone around each subset (the same buffer that split_with_buffer uses to keep subsets apart), so a negative chip
+     can only be assigned to the subset whose labels surround it.
+
+     @param split_results - Output of autosplit.split_with_buffer. It must have the 'subset' column.
+     @param tile_size - Side length of the training tiles, in CRS units. Use the same value as for split_with_buffer.
+
+     @return generator of dicts with tile_id, minx, miny, maxx, maxy, subset and an empty uids list
+    """
+    buffer_distance = np.sqrt(tile_size**2 * 2)
+
+    for subset, subset_df in split_results.groupby('subset', sort=True):
+        zones = gpd.GeoSeries(
+            subset_df.geometry.values.buffer(buffer_distance), crs=split_results.crs
+        )
+
+        cols, rows = covering_tiles(zones.bounds.values, tile_size)
+        boxes = tile_boxes(cols, rows, tile_size)
+
+        covered = np.zeros(len(boxes), dtype=bool)
+        covered[np.unique(zones.sindex.query(boxes, predicate='covered_by')[0])] = True
+
+        touches_label = np.zeros(len(boxes), dtype=bool)
+        touches_label[np.unique(subset_df.sindex.query(boxes, predicate='intersects')[0])] = True
+
+        for idx in np.flatnonzero(covered & ~touches_label):
+            minx, miny, maxx, maxy = boxes[idx].bounds
+
+            yield {
+                'tile_id': str(cols[idx]) + '_' + str(rows[idx]),
+                'minx': minx,
+                'miny': miny,
+                'maxx': maxx,
+                'maxy': maxy,
+                'subset': subset,
+                'uids': []
+            }
+
+
+def _check_subsets_disjoint(split_results, tile_size):
+    """
+     Raises an error if a tile contains labels from more than one subset, which would leak data between subsets.
+    """
+    cols, rows = covering_tiles(split_results.geometry.values.bounds, tile_size)
+    boxes = tile_boxes(cols, rows, tile_size)
+    tile_idx, label_idx = split_results.sindex.query(boxes, predicate='intersects')
+    pairs = pd.DataFrame({'tile': tile_idx, 'subset': split_results['subset'].values[label_idx]})
+
+    n_subsets = pairs.groupby('tile')['subset'].nunique()
+    if (n_subsets > 1).any():
+        leaking = n_subsets[n_subsets > 1].index
+        raise ValueError(
+            'Tiles {tiles} contain labels from more than one subset. Was split_with_buffer run with the same tile_size?'
+            .format(tiles=tile_ids(cols[leaking], rows[leaking])))
+
+
+def write_chips(chips, out_dir, prefix, chunk_size=10000):
+    """
+     Writes a stream of chips to one parquet file per subset. Chips are buffered and written in row groups of
+     chunk_size, so the full manifest is never held in memory.
+
+     @param chips - Generator of chip dicts, from chip_manifest or negative_chips.
+     @param out_dir - The directory in which to save the files.
+     @param prefix - Prefix of the file names, e.g. 'positive' or 'negative'. Files are named '{prefix}_{subset}.parquet'.
+     @param chunk_size - Number of chips per row group.
+
+     @return dict of subset name to file path
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('tile_id', pa.string()),
+        ('minx', pa.float64()),
+        ('miny', pa.float64()),
+        ('maxx', pa.float64()),
+        ('maxy', pa.float64()),
+        ('subset', pa.string()),
+        ('uids', pa.list_(pa.string()))
+    ])
+
+    out_dir = Path(out_dir)
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    writers = {}
+    buffers = {}
+    filepaths = {}
+
+    def flush(subset):
+        if len(buffers[subset]) > 0:
+            writers[subset].write_table(pa.Table.from_pylist(buffers[subset], schema=schema))
+            buffers[subset] = []
+
+    try:
+        for chip in chips:
+            subset = chip['subset']
+            if subset not in writers:
+                filepaths[subset] = out_dir / (prefix + '_' + str(subset) + '.parquet')
+                writers[subset] = pq.ParquetWriter(filepaths[subset], schema)
+                buffers[subset] = []
+
+            buffers[subset].append(chip)
+            if len(buffers[subset]) >= chunk_size:
+                flush(subset)
+
+        for subset in writers:
+            flush(subset)
+
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    return filepaths
+
+
+def rasterize_tile(geometries, values, bounds, resolution):
+    """
+     Burns geometries into a mask covering one tile. A pixel is burned if its center is within a geometry, and later
+     geometries are burned over earlier ones.
+
+     @param geometries - Array of shapely geometries.
+     @param values - Value to burn for each geometry.
+     @param bounds - (minx, miny, maxx, maxy) of the tile.
+     @param resolution - Pixel size, in CRS units.
+
+     @return uint8 numpy array of shape (rows, columns), with the first row at the top of the tile
+    """
+    minx, miny, maxx, maxy = bounds
+    n_cols = int(round((maxx - minx) / resolution))
+    n_rows = int(round((maxy - miny) / resolution))
+    mask = np.full((n_rows, n_cols), BACKGROUND, dtype=np.uint8)
+
+    for geometry, value in zip(geometries, values):
+        # only test the pixel centers within the bounding box of the geometry
+        gminx, gminy, gmaxx, gmaxy = geometry.bounds
+        col_start = max(int(np.floor((gminx - minx) / resolution)), 0)
+        col_end = min(int(np.ceil((gmaxx - minx) / resolution)), n_cols)
+        row_start = max(int(np.floor((maxy - gmaxy) / resolution)), 0)
+        row_end = min(int(np.ceil((maxy - gminy) / resolution)), n_rows)
+        if col_start >= col_end or row_start >= row_end:
+            continue
+
+        xs = minx + (np.arange(col_start, col_end) + 0.5) * resolution
+        ys = maxy - (np.arange(row_start, row_end) + 0.5) * resolution
+        xs, ys = np.meshgrid(xs, ys)
+
+        inside = shapely.contains_xy(geometry, xs, ys)
+        mask[row_start:row_end, col_start:col_end][inside] = value
+
+    return mask
+
+
+def _rasterize_batch(batch, resolution):
+    """
+     Rasterizes a batch of tiles in a worker process. The batch only holds the WKB of the geometries it needs.
+    """
+    tile_ids = []
+    masks = []
+
+    for tile_id, bounds, wkb, values in batch:
+        tile_ids.append(tile_id)
+        masks.append(rasterize_tile(shapely.from_wkb(wkb), values, bounds, resolution))
+
+    return tile_ids, np.stack(masks)
+
+
+def write_masks(split_results, tile_size, resolution, out_dir, df=None, negative_value=BACKGROUND, batch_size=256,
+                max_workers=None):
+    """
+     Streams label masks for every tile of the grid which intersects the split results and saves them as compressed
+     arrays, one directory per subset. Positive polygons are burned as RTS. Negative bounding boxes are burned first
+     with negative_value, so positives within them are kept. Tiles are rasterized in batches across a process pool,
+     and only a few batches are held in memory at a time.
+
+     @param split_results - Output of autosplit.split_with_buffer. It must have the 'ID' and 'subset' columns.
+     @param tile_size - Side length of the training tiles, in CRS units. Use the same value as for split_with_buffer.
+     @param resolution - Pixel size of the masks, in CRS units.
+     @param out_dir - The directory in which to save the masks. Files are named '{subset}/masks_{batch}.npz' and hold
+                      'tile_ids' and 'masks' arrays.
+     @param df - The dataframe that was split, with 'ID' and 'TrainClass' columns. Required unless split_results has
+                 a TrainClass column.
+     @param negative_value - Value for negative bounding boxes: BACKGROUND (0) or IGNORE (255).
+     @param batch_size - Number of tiles per batch and per file.
+     @param max_workers - Number of worker processes. Defaults to the number of CPUs.
+
+     @return dict of subset name to list of file paths
+    """
+    out_dir = Path(out_dir)
+    geometries = np.asarray(split_results.geometry.values)
+
+    if df is not None:
+        train_class = split_results['ID'].map(pd.DataFrame(df[['ID', 'TrainClass']]).drop_duplicates('ID').set_index(
+            'ID')['TrainClass'])
+        if train_class.isna().any():
+            raise ValueError('{count} features of the split results have no TrainClass in df.'.format(
+                count=train_class.isna().sum()))
+    elif 'TrainClass' in split_results.columns:
+        train_class = split_results['TrainClass']
+    else:
+        raise ValueError(
+            'The split results have no TrainClass column. Pass the dataframe that was split as df, so negatives are '
+            'not burned as RTS.')
+    values = np.where(train_class.astype(str).values == 'Negative', negative_value, RTS).astype(np.uint8)
+
+    def batches():
+        batch = []
+        batch_subset = None
+        for subset, tile_id, box, positions in _label_tiles(split_results, tile_size):
+            if len(batch) == batch_size or (batch_subset is not None and subset != batch_subset):
+                yield batch_subset, batch
+                batch = []
+
+            # negatives first, so positives are burned over them
+            positions = positions[np.argsort(values[positions] == RTS, kind='stable')]
+            batch.append((tile_id, box.bounds, shapely.to_wkb(geometries[positions]), values[positions]))
+            batch_subset = subset
+
+        if len(batch) > 0:
+            yield batch_subset, batch
+
+    filepaths = {}
+    counts = {}
+
+    def save(subset, result):
+        tile_ids, masks = result
+        if not os.path.exists(out_dir / str(subset)):
+            os.makedirs(out_dir / str(subset))
+
+        counts[subset] = counts.get(subset, 0)
+        filepath = out_dir / str(subset) / ('masks_' + str(counts[subset]).zfill(5) + '.npz')
+        np.savez_compressed(filepath, tile_ids=np.array(tile_ids), masks=masks)
+
+        counts[subset] = counts[subset] + 1
+        filepaths[subset] = filepaths.get(subset, []) + [filepath]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for subset, batch in batches():
+            pending.append((subset, executor.submit(_rasterize_batch, batch, resolution)))
+
+            # bound the number of batches in flight
+            if len(pending) >= 2 * max_workers:
+                subset, future = pending.pop(0)
+                save(subset, future.result())
+
+        for subset, future in pending:
+            save(subset, future.result())
+
+    return filepaths
@@ -0,0 +1,427 @@
+'''
+Fast validation of the metadata of an RTS data set, e.g. as a pre-commit hook on contributions:
+
+    python -m ARTS.validate new_rts_data.geojson
+    python -m ARTS.validate new_rts_data.shp --metadata Metadata_Format_Summary.csv
+
+Only the attribute table is read, in one pass and without decoding geometries, and only the standard library is
+imported, so this starts much faster than importing dataformatting. The checks and their messages are the same as
+those of dataformatting.run_formatting_checks and dataformatting.check_uids.
+'''
+import argparse
+import csv
+import json
+import math
+import re
+import struct
+import sys
+from datetime import datetime
+from pathlib import Path
+
+
+# abbreviated shapefile column names, as renamed in dataformatting.preprocessing
+SHAPEFILE_ABBREVIATIONS = {
+    'CntrdLt': 'CentroidLat', 'CntrdLn': 'CentroidLon', 'ReginNm': 'RegionName', 'CretrLb': 'CreatorLab',
+    'BasMpDt': 'BaseMapDate', 'BsMpSrc': 'BaseMapSource', 'BsMpRsl': 'BaseMapResolution', 'TrnClss': 'TrainClass',
+    'LablTyp': 'LabelType', 'MrgdRTS': 'MergedRTS', 'StblRTS': 'StabilizedRTS', 'UnknwnR': 'UnknownRelationship',
+    'ContrDt': 'ContributionDate', 'BsMpID': 'BaseMapID'
+}
+
+METADATA_SUMMARY_NAME = 'Metadata_Format_Summary.csv'
+
+CHUNK_SIZE = 1 << 20
+
+
+def find_metadata_summary():
+    '''
+    Finds the metadata format summary, which is installed with the package (it is the only copy, also read by the
+    formatting notebooks), else the one in the working directory.
+
+    @return file path of Metadata_Format_Summary.csv, or None if there is none
+    '''
+    try:
+        from importlib.resources import files
+        candidates = [files(__package__ or 'ARTS') / METADATA_SUMMARY_NAME]
+    except (ImportError, ModuleNotFoundError, TypeError):
+        candidates = [Path(__file__).with_name(METADATA_SUMMARY_NAME)]
+    candidates.append(Path.cwd() / METADATA_SUMMARY_NAME)
+
+    for candidate in candidates:
+        if candidate.is_file():
+            return candidate
+
+    return None
+
+
+# default location of the metadata summary
+METADATA_SUMMARY = find_metadata_summary()
+
+
+def read_metadata_summary(filepath=METADATA_SUMMARY):
+    '''
+    Reads the metadata format summary.
+
+    @param filepath - The file path of Metadata_Format_Summary.csv.
+
+    @return dict of field name to {'Format', 'Required', 'Description'}
+    '''
+    if filepath is None:
+        raise ValueError(METADATA_SUMMARY_NAME + ' was not found. Pass its file path with --metadata.')
+    if not hasattr(filepath, 'open'):
+        filepath = Path(filepath)
+
+    with filepath.open(newline='', encoding='utf-8') as file:
+        return {row['FieldName']: row for row in csv.DictReader(file)}
+
+
+def iter_dbf_records(filepath, encoding=None):
+    '''
+    Reads the records of a dBASE file (the attribute table of a shapefile) one at a time. Character fields are
+    returned as strings (None if blank), numeric fields as int or float (None if blank), logical fields as bool and date fields as
+    'YYYY-MM-DD' strings.
+
+    @param filepath - The file path of the .dbf file.
+    @param encoding - Encoding of character fields. Defaults to the .cpg file if there is one, else ISO-8859-1.
+
+    @return generator of dicts
+    '''
+    filepath = Path(filepath)
+    if encoding is None:
+        cpg = filepath.with_suffix('.cpg')
+        encoding = cpg.read_text().strip() if cpg.exists() else 'ISO-8859-1'
+
+    with open(filepath, 'rb') as file:
+        header = file.read(32)
+        n_records, header_length, record_length = struct.unpack('<IHH', header[4:12])
+
+        fields = []
+        while file.tell() < header_length - 1:
+            descriptor = file.read(32)
+            if descriptor[0] == 0x0D:
+                break
+            name = descriptor[:11].split(b'\x00')[0].decode('ascii')
+            fields.append((name, chr(descriptor[11]), descriptor[16], descriptor[17]))
+
+        file.seek(header_length)
+        for _ in range(n_records):
+            record = file.read(record_length)
+            if len(record) < record_length:
+                break
+            if record[:1] == b'*':
+                continue
+
+            values = {}
+            position = 1
+            for name, field_type, length, decimals in fields:
+                raw = record[position:position + length]
+                position = position + length
+
+                if field_type == 'C':
+                    # blank character fields are read as missing, as GDAL does
+                    text = raw.decode(encoding).rstrip(' \x00')
+                    values[name] = text if text != '' else None
+                elif field_type in 'NF':
+                    text = raw.decode('ascii').strip(' \x00')
+                    if text == '' or text.startswith('*'):
+                        values[name] = None
+                    elif field_type == 'F' or decimals > 0 or '.' in text or 'e' in text.lower():
+                        values[name] = float(text)
+                    else:
+                        values[name] = int(text)
+                elif field_type == 'L':
+                    text = raw.decode('ascii').strip()
+                    values[name] = None if text in ['', '?'] else text in 'YyTt'
+                elif field_type == 'D':
+                    text = raw.decode('ascii').strip()
+                    values[name] = text[:4] + '-' + text[4:6] + '-' + text[6:8] if len(text) == 8 else None
+                else:
+                    values[name] = raw.decode(encoding).strip()
+
+            yield values
+
+
+def iter_geojson_properties(filepath):
+    '''
+    Reads the properties of the features of a GeoJSON file one feature at a time, so memory use does not depend on
+    the size of the file.
+
+    @param filepath - The file path of the GeoJSON file.
+
+    @return generator of dicts
+    '''
+    decoder = json.JSONDecoder()
+
+    with open(filepath, encoding='utf-8') as file:
+        buffer = ''
+        position = None
+
+        # find the start of the features array
+        while position is None:
+            chunk = file.read(CHUNK_SIZE)
+            if chunk == '':
+                return
+            buffer = buffer + chunk
+            match = re.search(r'"features"\s*:\s*\[', buffer)
+            if match is not None:
+                position = match.end()
+
+        end_of_file = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position = position + 1
+
+            if position < len(buffer) and buffer[position] == ']':
+                return
+
+            try:
+                feature, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if end_of_file:
+                    raise
+                chunk = file.read(CHUNK_SIZE)
+                end_of_file = chunk == ''
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield feature.get('properties') or {}
+
+            buffer = buffer[end:]
+            position = 0
+
+
+def iter_records(filepath):
+    '''
+    Reads the attribute table of a GeoJSON file or shapefile. Abbreviated shapefile column names are expanded.
+
+    @param filepath - The file path of a .geojson, .json, .shp or .dbf file.
+
+    @return generator of dicts
+    '''
+    filepath = Path(filepath)
+    extension = filepath.suffix.lower()
+
+    if extension in ['.geojson', '.json']:
+        return iter_geojson_properties(filepath)
+    elif extension in ['.shp', '.dbf']:
+        records = iter_dbf_records(filepath.with_suffix('.dbf'))
+        return ({SHAPEFILE_ABBREVIATIONS.get(key, key): value for key, value in record.items()}
+                for record in records)
+    else:
+        raise ValueError('{name} is not a GeoJSON file or shapefile.'.format(name=repr(str(filepath))))
+
+
+def _is_missing(value):
+    return value is None or isinstance(value, float) and math.isnan(value)
+
+
+def _is_date(value):
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+class _Column:
+    '''
+    Summary of one column, updated one value at a time, with everything the checks need.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.missing = False
+        self.empty = False
+        self.numeric = True
+        self.any_float = False
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.dates = True
+        self.date_missing = False
+        self.train_classes = True
+        self.uid_lengths = True
+        self.uid_components = True
+
+    def update(self, value):
+        if self.count == 0:
+            self.first = value
+        self.count = self.count + 1
+
+        if _is_missing(value):
+            self.missing = True
+            self.any_float = True
+            self.dates = False
+            self.train_classes = False
+            return
+
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            self.numeric = False
+        else:
+            self.any_float = self.any_float or isinstance(value, float)
+            self.minimum = min(self.minimum, value)
+            self.maximum = max(self.maximum, value)
+
+        if not isinstance(value, str):
+            self.dates = False
+            self.train_classes = False
+            self.uid_lengths = False
+            return
+
+        self.empty = self.empty or value == ''
+
+        parts = value.split(',')
+        self.dates = self.dates and any(_is_date(part) for part in parts)
+        self.date_missing = self.date_missing or parts[0] == ''
+
+        self.train_classes = self.train_classes and value in ['Negative', 'Positive']
+
+        parts = value.split('-')
+        self.uid_lengths = self.uid_lengths and [len(part) for part in parts] == [8, 4, 4, 4, 12]
+        self.uid_components = self.uid_components and all(re.search('^[0-9a-f]+$', part) for part in parts)
+
+    def is_float(self):
+        # a column is read as floats if all values are numbers and at least one is a float or missing
+        return self.count > 0 and self.numeric and self.any_float
+
+    def is_string(self):
+        return isinstance(self.first, str)
+
+
+def _check_coordinate(column, field, name, range_name, low, high):
+    if not column.is_float():
+        raise ValueError(
+            'The {field} column is not numeric. Ensure that {name} is reported as decimal degress in WGS 84.'
+            .format(field=field, name=name))
+    elif column.missing:
+        raise ValueError('The {field} column is missing values.'.format(field=field))
+    elif column.minimum < low or column.maximum > high:
+        raise ValueError(
+            'Unexpected values found in the {field} column. Ensure that {name} is listed as decimal degress in WGS 84.'
+            .format(field=field, name=range_name))
+
+
+def _check_string(column, field):
+    if not column.is_string():
+        raise ValueError('The {field} column is not a string.'.format(field=field))
+    elif column.empty:
+        raise ValueError('The {field} column is missing values.'.format(field=field))
+
+
+def run_checks(columns, required_fields, check_uid=True):
+    '''
+    Runs the formatting checks on the column summaries, in the same order as dataformatting.run_formatting_checks
+    and dataformatting.check_uids. Raises a ValueError with the same message at the first failed check.
+
+    @param columns - Dict of field name to _Column.
+    @param required_fields - A list of required metadata fields.
+    @param check_uid - Boolean. Should the UID column be checked?
+    '''
+    for field in required_fields:
+        if field not in columns:
+            raise ValueError('{field} is missing. Ensure that all required fields are present prior to running this script'
+                             .format(field=repr(field)))
+
+    _check_coordinate(columns['CentroidLat'], 'CentroidLat', 'latitude', 'CentroidLat', -90, 90)
+    _check_coordinate(columns['CentroidLon'], 'CentroidLon', 'longitude', 'longitude', -180, 180)
+    _check_string(columns['RegionName'], 'RegionName')
+    _check_string(columns['CreatorLab'], 'CreatorLab')
+
+    if not columns['BaseMapDate'].dates:
+        raise ValueError(
+            'The BaseMapDate column does not contain dates (or they are improperly formatted).')
+    elif columns['BaseMapDate'].date_missing:
+        raise ValueError('The BaseMapDate column is missing values.')
+
+    _check_string(columns['BaseMapSource'], 'BaseMapSource')
+
+    if not columns['BaseMapResolution'].is_float():
+        raise ValueError('The BaseMapResolution column is not a numeric.')
+    elif columns['BaseMapResolution'].missing:
+        raise ValueError('The BaseMapResolution column is missing values.')
+
+    if not columns['TrainClass'].train_classes:
+        raise ValueError('The TrainClass column contains values other than "Negative" and "Positive".')
+    elif columns['TrainClass'].empty:
+        raise ValueError('The TrainClass column is missing values.')
+
+    _check_string(columns['LabelType'], 'LabelType')
+
+    print('Formatting looks good!')
+
+    if check_uid and 'UID' in columns:
+        uid = columns['UID']
+        if not uid.is_string():
+            raise ValueError('The UID column is in the incorrect format (UUID5 has not been used).')
+        elif uid.empty:
+            raise ValueError('The UID column is missing values.')
+        elif not uid.uid_lengths:
+            raise ValueError('The UID column is in the incorrect format (UUID5 has not been used).')
+        elif not uid.uid_components:
+            raise ValueError('The UID column is in the incorrect format (UUID5 has not been used).')
+
+
+def validate(filepath, metadata_filepath=METADATA_SUMMARY, check_uid=True):
+    '''
+    Validates the metadata of an RTS data set in one pass over its attribute table.
+
+    @param filepath - The file path of a GeoJSON file or shapefile.
+    @param metadata_filepath - The file path of Metadata_Format_Summary.csv.
+    @param check_uid - Boolean. Should the UID column be checked, if there is one?
+
+    @return number of features
+    '''
+    metadata = read_metadata_summary(metadata_filepath)
+    required_fields = [field for field, row in metadata.items() if row['Required'] == 'True']
+
+    columns = {}
+    count = 0
+    for record in iter_records(filepath):
+        count = count + 1
+        for field, value in record.items():
+            if field not in columns:
+                # a column which is missing from earlier features has missing values there
+                columns[field] = _Column()
+                for _ in range(count - 1):
+                    columns[field].update(None)
+            columns[field].update(value)
+
+        for field, column in columns.items():
+            if column.count < count:
+                column.update(None)
+
+    if count == 0:
+        raise ValueError('{name} does not contain any features.'.format(name=repr(str(filepath))))
+
+    run_checks(columns, required_fields, check_uid)
+
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m ARTS.validate',
+        description='Checks the metadata of RTS data sets without loading their geometries.')
+    parser.add_argument('filepaths', nargs='+', help='GeoJSON files or shapefiles to validate.')
+    parser.add_argument('--metadata', default=METADATA_SUMMARY, help='File path of Metadata_Format_Summary.csv.')
+    parser.add_argument('--skip-uid', action='store_true', help='Do not check the UID column.')
+    args = parser.parse_args(argv)
+
+    if args.metadata is None:
+        parser.error(METADATA_SUMMARY_NAME + ' was not found. Pass its file path with --metadata.')
+
+    failed = 0
+    for filepath in args.filepaths:
+        print(filepath)
+        try:
+            count = validate(filepath, args.metadata, not args.skip_uid)
+            print('{count} features checked.'.format(count=count))
+        except (ValueError, OSError) as error:
+            print('Error: ' + str(error), file=sys.stderr)
+            failed = failed + 1
+
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,420 @@
+import gzip
+import json
+import math
+import os
+import sqlite3
+import numpy as np
+import pandas as pd
+import shapely
+from concurrent.futures import ProcessPoolExecutor
+from .schema import publishable
+
+
+# half the width of the web mercator world, in meters
+WORLD_HALF_SIZE = 20037508.342789244
+
+# size of a tile in the coordinates of the vector tile
+EXTENT = 4096
+
+# geometry types of the vector tile format
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+
+
+def tile_bounds(z, x, y):
+    '''
+    Gets the bounds of a tile in web mercator (EPSG:3857), with y counted from the top as in XYZ tile URLs.
+
+    @return (minx, miny, maxx, maxy)
+    '''
+    size = 2 * WORLD_HALF_SIZE / 2**z
+
+    return (-WORLD_HALF_SIZE + x * size, WORLD_HALF_SIZE - (y + 1) * size,
+            -WORLD_HALF_SIZE + (x + 1) * size, WORLD_HALF_SIZE - y * size)
+
+
+def tile_ranges(bounds, z):
+    '''
+    Gets the range of tiles covered by bounding boxes at a zoom level.
+
+    @param bounds - Array of (minx, miny, maxx, maxy) in web mercator.
+    @param z - The zoom level.
+
+    @return (x_min, x_max, y_min, y_max) arrays of tile indexes, inclusive
+    '''
+    n = 2**z
+    size = 2 * WORLD_HALF_SIZE / n
+
+    def index(values):
+        return np.clip(np.floor(values / size).astype(np.int64), 0, n - 1)
+
+    return (index(bounds[:, 0] + WORLD_HALF_SIZE), index(bounds[:, 2] + WORLD_HALF_SIZE),
+            index(WORLD_HALF_SIZE - bounds[:, 3]), index(WORLD_HALF_SIZE - bounds[:, 1]))
+
+
+# protocol buffer encoding
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value = value >> 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(value) for value in values))
+
+
+def _encode_value(value):
+    # Value message: string = 1, double = 3, uint = 5, sint = 6, bool = 7
+    if isinstance(value, (bool, np.bool_)):
+        return _varint_field(7, int(value))
+    if isinstance(value, (int, np.integer)):
+        return _varint_field(5, int(value)) if value >= 0 else _varint_field(6, _zigzag(int(value)))
+    if isinstance(value, (float, np.floating)):
+        return _key(3, 1) + np.float64(value).tobytes()
+
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+def _encode_points(coordinates, cursor):
+    '''
+    Encodes points as MoveTo commands, relative to the cursor.
+    '''
+    commands = [_command(1, len(coordinates))]
+    for x, y in coordinates:
+        commands += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+        cursor = (x, y)
+
+    return commands, cursor
+
+
+def _encode_line(coordinates, cursor, close):
+    '''
+    Encodes a line string or ring as MoveTo, LineTo and (for rings) ClosePath commands, relative to the cursor.
+    '''
+    x, y = coordinates[0]
+    commands = [_command(1, 1), _zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+    cursor = (x, y)
+
+    commands.append(_command(2, len(coordinates) - 1))
+    for x, y in coordinates[1:]:
+        commands += [_zigzag(x - cursor[0]), _zigzag(y - cursor[1])]
+        cursor = (x, y)
+
+    if close:
+        commands.append(_command(7, 1))
+
+    return commands, cursor
+
+
+def _tile_coordinates(coordinates, bounds):
+    '''
+    Converts web mercator coordinates to integer tile coordinates (y down) and removes repeated points.
+    '''
+    minx, miny, maxx, maxy = bounds
+    x = np.round((coordinates[:, 0] - minx) / (maxx - minx) * EXTENT).astype(np.int64)
+    y = np.round((maxy - coordinates[:, 1]) / (maxy - miny) * EXTENT).astype(np.int64)
+    points = np.stack([x, y], axis=1)
+
+    keep = np.r_[True, np.any(points[1:] != points[:-1], axis=1)]
+
+    return [tuple(point) for point in points[keep].tolist()]
+
+
+def _ring_area(ring):
+    # surveyor's formula in tile coordinates; positive for exterior rings in the vector tile format
+    points = np.asarray(ring, dtype=np.float64)
+    return 0.5 * np.sum(points[:-1, 0] * points[1:, 1] - points[1:, 0] * points[:-1, 1])
+
+
+def encode_geometry(geometry, bounds):
+    '''
+    Encodes a shapely geometry as vector tile geometry commands.
+
+    @param geometry - A shapely geometry in web mercator, already clipped to the tile.
+    @param bounds - The bounds of the tile.
+
+    @return (geometry type, list of commands), or (None, []) if nothing is left at tile precision
+    '''
+    parts = shapely.get_parts(geometry)
+    types = shapely.get_type_id(parts)
+    cursor = (0, 0)
+    commands = []
+
+    # clipping can leave lines or points where a polygon touches the clip box; keep the highest dimension only
+    geometry_type = 3 if np.any(types == 3) else 1 if np.any(types == 1) else 0 if np.any(types == 0) else -1
+    parts = parts[types == geometry_type]
+
+    if geometry_type == 0:
+        points = [_tile_coordinates(shapely.get_coordinates(part), bounds)[0] for part in parts]
+        commands, cursor = _encode_points(points, cursor)
+        return POINT, commands
+
+    if geometry_type == 1:
+        for part in parts:
+            line = _tile_coordinates(shapely.get_coordinates(part), bounds)
+            if len(line) >= 2:
+                line_commands, cursor = _encode_line(line, cursor, close=False)
+                commands += line_commands
+        return (LINESTRING, commands) if len(commands) > 0 else (None, [])
+
+    if geometry_type == 3:
+        for part in parts:
+            rings = [shapely.get_exterior_ring(part)] + list(
+                shapely.get_interior_ring(part, np.arange(shapely.get_num_interior_rings(part))))
+            for idx, ring in enumerate(rings):
+                ring = _tile_coordinates(shapely.get_coordinates(ring), bounds)
+                if len(ring) < 4:
+                    if idx == 0:
+                        break
+                    continue
+
+                # exterior rings must have a positive area and interior rings a negative area
+                area = _ring_area(ring)
+                if area == 0:
+                    if idx == 0:
+                        break
+                    continue
+                if (area < 0) == (idx == 0):
+                    ring = ring[::-1]
+
+                ring_commands, cursor = _encode_line(ring[:-1], cursor, close=True)
+                commands += ring_commands
+        return (POLYGON, commands) if len(commands) > 0 else (None, [])
+
+    return None, []
+
+
+def encode_tile(layer_name, features, bounds):
+    '''
+    Encodes one layer of features as a Mapbox Vector Tile (version 2).
+
+    @param layer_name - The name of the layer.
+    @param features - List of (feature id, shapely geometry in web mercator, dict of attributes).
+    @param bounds - The bounds of the tile.
+
+    @return the tile, as bytes
+    '''
+    keys = {}
+    values = {}
+    encoded_features = []
+
+    for feature_id, geometry, attributes in features:
+        geometry_type, commands = encode_geometry(geometry, bounds)
+        if geometry_type is None:
+            continue
+
+        tags = []
+        for key, value in attributes.items():
+            if value is None or isinstance(value, float) and math.isnan(value):
+                continue
+            encoded_value = _encode_value(value)
+            tags += [keys.setdefault(key, len(keys)), values.setdefault(encoded_value, len(values))]
+
+        encoded_features.append(_bytes_field(2, (
+            _varint_field(1, feature_id) +
+            (_packed_field(2, tags) if len(tags) > 0 else b'') +
+            _varint_field(3, geometry_type) +
+            _packed_field(4, commands)
+        )))
+
+    layer = (
+        _varint_field(15, 2) +
+        _bytes_field(1, layer_name.encode('utf-8')) +
+        b''.join(encoded_features) +
+        b''.join(_bytes_field(3, key.encode('utf-8')) for key in keys) +
+        b''.join(_bytes_field(4, value) for value in values) +
+        _varint_field(5, EXTENT)
+    )
+
+    return _bytes_field(3, layer)
+
+
+def _build_tiles(batch, layer_name, buffer):
+    '''
+    Clips and encodes a batch of tiles in a worker process.
+    '''
+    tiles = []
+
+    for z, x, y, feature_ids, wkb, attributes in batch:
+        bounds = tile_bounds(z, x, y)
+        margin = (bounds[2] - bounds[0]) * buffer / EXTENT
+        clip_box = shapely.box(bounds[0] - margin, bounds[1] - margin, bounds[2] + margin, bounds[3] + margin)
+
+        geometries = shapely.from_wkb(wkb)
+        inside = shapely.covered_by(geometries, clip_box)
+        geometries = np.where(inside, geometries, shapely.intersection(geometries, clip_box))
+
+        features = [
+            (feature_id, geometry, feature_attributes)
+            for feature_id, geometry, feature_attributes in zip(feature_ids, geometries, attributes)
+            if not shapely.is_empty(geometry)
+        ]
+        if len(features) > 0:
+            tiles.append((z, x, y, gzip.compress(encode_tile(layer_name, features, bounds))))
+
+    return tiles
+
+
+def _zoom_geometries(geometry, z, min_pixels):
+    '''
+    Simplifies geometries to the resolution of a zoom level. Polygons smaller than min_pixels pixels (of a 256 pixel
+    tile) are replaced by a point within them, so small features are still visible when zoomed out.
+    '''
+    pixel_size = 2 * WORLD_HALF_SIZE / 2**z / 256
+    simplified = shapely.simplify(geometry, pixel_size / 4, preserve_topology=True)
+
+    small = shapely.area(geometry) < min_pixels * pixel_size**2
+    small = small & np.isin(shapely.get_type_id(geometry), [3, 6])
+    simplified[small] = shapely.point_on_surface(geometry[small])
+
+    return simplified
+
+
+def write_mbtiles(data, filepath, min_zoom=0, max_zoom=14, layer_name='ARTS', fields=None, detail_zoom=None,
+                  overview_fields=('TrainClass', 'subset'), min_pixels=1, buffer=64, batch_size=256,
+                  max_workers=None):
+    '''
+    Exports a release or split result as a pyramid of vector tiles in an MBTiles file (a single SQLite file), which
+    web map viewers load tile by tile instead of reading every feature. Geometries are simplified to the resolution
+    of each zoom level, features smaller than a pixel are drawn as points, and zoom levels below detail_zoom only
+    carry a few attributes. Tiles are built in parallel in a pool of worker processes.
+
+    @param data - The ARTS data set or split result, in any CRS.
+    @param filepath - The file path of the MBTiles file. An existing file is replaced.
+    @param min_zoom - The lowest zoom level.
+    @param max_zoom - The highest zoom level.
+    @param layer_name - The name of the vector tile layer.
+    @param fields - Optional list of attribute columns to include. Defaults to all columns.
+    @param detail_zoom - Zoom level from which all fields are included. Defaults to max_zoom - 2.
+    @param overview_fields - Fields included below detail_zoom, if they are present.
+    @param min_pixels - Polygons with a smaller area, in pixels, are drawn as points.
+    @param buffer - Width of the margin around each tile, in tile coordinates (4096 per tile).
+    @param batch_size - Number of tiles per batch sent to a worker process.
+    @param max_workers - Number of worker processes. Defaults to the number of CPUs.
+
+    @return file path of the MBTiles file
+    '''
+    if detail_zoom is None:
+        detail_zoom = max(max_zoom - 2, min_zoom)
+
+    data = publishable(data).to_crs(3857)
+    geometry = np.asarray(data.geometry.values)
+
+    fields = [column for column in data.columns if column != data.geometry.name] if fields is None else list(fields)
+    overview_fields = [field for field in overview_fields if field in fields]
+
+    attributes = pd.DataFrame(data[fields]).astype(object).where(pd.notna(data[fields]), None)
+    detail_attributes = attributes.to_dict('records')
+    overview_attributes = attributes[overview_fields].to_dict('records')
+
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+    connection = sqlite3.connect(filepath)
+    connection.execute('CREATE TABLE metadata (name text, value text)')
+    connection.execute('CREATE TABLE tiles (zoom_level integer, tile_column integer, tile_row integer, tile_data blob)')
+
+    def batches():
+        for z in range(min_zoom, max_zoom + 1):
+            zoom_geometry = _zoom_geometries(geometry, z, min_pixels)
+            zoom_attributes = detail_attributes if z >= detail_zoom else overview_attributes
+            keep = ~shapely.is_empty(zoom_geometry)
+
+            # pairs of tile and feature, from the tile range of each feature's bounding box
+            positions = np.flatnonzero(keep)
+            x_min, x_max, y_min, y_max = tile_ranges(shapely.bounds(zoom_geometry[positions]), z)
+            counts = (x_max - x_min + 1) * (y_max - y_min + 1)
+            feature = np.repeat(positions, counts)
+            offset = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            width = np.repeat(x_max - x_min + 1, counts)
+            tile_x = np.repeat(x_min, counts) + offset % width
+            tile_y = np.repeat(y_min, counts) + offset // width
+
+            order = np.lexsort((feature, tile_y, tile_x))
+            feature, tile_x, tile_y = feature[order], tile_x[order], tile_y[order]
+            starts = np.flatnonzero(np.r_[True, (tile_x[1:] != tile_x[:-1]) | (tile_y[1:] != tile_y[:-1])])
+            ends = np.r_[starts[1:], len(feature)]
+
+            batch = []
+            for start, end in zip(starts, ends):
+                tile_features = feature[start:end]
+                batch.append((
+                    z, int(tile_x[start]), int(tile_y[start]), [int(item) for item in tile_features],
+                    shapely.to_wkb(zoom_geometry[tile_features]), [zoom_attributes[item] for item in tile_features]
+                ))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if len(batch) > 0:
+                yield batch
+
+    def save(tiles):
+        # MBTiles counts tile rows from the bottom
+        connection.executemany(
+            'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+            [(z, x, 2**z - 1 - y, sqlite3.Binary(tile)) for z, x, y, tile in tiles]
+        )
+
+    max_workers = max_workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = []
+        for batch in batches():
+            pending.append(executor.submit(_build_tiles, batch, layer_name, buffer))
+
+            # bound the number of batches in flight
+            if len(pending) >= 2 * max_workers:
+                save(pending.pop(0).result())
+
+        for future in pending:
+            save(future.result())
+
+    connection.execute('CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)')
+
+    lon_lat = data.to_crs(4326).total_bounds
+    metadata = {
+        'name': layer_name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': ','.join(str(round(value, 6)) for value in lon_lat),
+        'center': '{lon},{lat},{zoom}'.format(
+            lon=round((lon_lat[0] + lon_lat[2]) / 2, 6), lat=round((lon_lat[1] + lon_lat[3]) / 2, 6), zoom=min_zoom),
+        'json': json.dumps({'vector_layers': [{
+            'id': layer_name, 'minzoom': min_zoom, 'maxzoom': max_zoom,
+            'fields': {field: 'Number' if pd.api.types.is_numeric_dtype(data[field]) else 'String' for field in fields}
+        }]})
+    }
+    connection.executemany('INSERT INTO metadata VALUES (?, ?)', list(metadata.items()))
+    connection.commit()
+    connection.close()
+
+    return filepath